@@ -0,0 +1,185 @@
+import os
+from multiprocessing import cpu_count
+from shutil import copyfileobj, rmtree
+from subprocess import check_call
+from sys import argv
+from tempfile import mkdtemp
+
+from utils import fetch_all
+
+# The files formatdb creates for a nucleotide database, or the alias
+# file when the database is split into multiple volumes
+DATABASE_EXTENSIONS = ('.nhr', '.nin', '.nsq')
+DATABASE_ALIAS_EXTENSION = '.nal'
+# The option which sets the amount of threads of a BLAST program
+THREAD_OPTIONS = {'blastall': '-a', 'blastn': '-num_threads'}
+
+
+def database_is_current(fasta):
+    """ Checks whether formatdb has already been run on the FASTA file
+    after its last change.
+
+    Parameters:
+        fasta - string. The path of the FASTA file of the database.
+    Returns:
+        True when all database files exist and are newer than the FASTA
+        file, otherwise False.
+    """
+    if not os.path.exists(fasta):
+        return False
+    if os.path.exists(fasta + DATABASE_ALIAS_EXTENSION):
+        paths = [fasta + DATABASE_ALIAS_EXTENSION]
+    else:
+        paths = [fasta + extension for extension in DATABASE_EXTENSIONS]
+    fasta_time = os.path.getmtime(fasta)
+    return all(os.path.exists(path) and os.path.getmtime(path) >= fasta_time
+               for path in paths)
+
+
+def format_database(fasta):
+    """ Creates the nucleotide BLAST database of the FASTA file, unless
+    it is already up to date.
+
+    Parameters:
+        fasta - string. The path of the FASTA file.
+    Returns:
+        True when formatdb was run, False when it was skipped.
+    """
+    if database_is_current(fasta):
+        return False
+    check_call(['formatdb', '-i', fasta, '-p', 'F'])
+    return True
+
+
+def get_record_offsets(fasta):
+    """ Finds the start and end of every record in a FASTA file by
+    reading it line by line.
+
+    Parameters:
+        fasta - string. The path of the FASTA file.
+    Returns:
+        A list with a (start, end) byte offset tuple for each record.
+    """
+    offsets = []
+    position = 0
+    start = None
+    with open(fasta, 'rb') as file:
+        for line in file:
+            if line.startswith(b'>'):
+                if start is not None:
+                    offsets.append((start, position))
+                start = position
+            position += len(line)
+    if start is not None:
+        offsets.append((start, position))
+    return offsets
+
+
+def split_fasta(fasta, shards, directory):
+    """ Splits a FASTA file into shards of consecutive records with
+    about the same size. The shards keep the order of the records, so
+    the outputs of the shards can simply be joined.
+
+    Parameters:
+        fasta - string. The path of the FASTA file.
+        shards - int. The maximum amount of shards.
+        directory - string. The directory to write the shards to.
+    Returns:
+        A list with the paths of the shards, in the order of the file.
+    """
+    offsets = get_record_offsets(fasta)
+    shards = max(1, min(shards, len(offsets)))
+    total = offsets[-1][1] if offsets else 0
+    # Every shard ends at the first record which passes its share
+    ends = []
+    shard = 1
+    for start, end in offsets:
+        if end >= total * shard / float(shards):
+            ends.append(end)
+            shard += 1
+    paths = []
+    start = 0
+    with open(fasta, 'rb') as file:
+        for index, end in enumerate(ends):
+            path = os.path.join(directory, 'shard_{}.fa'.format(index))
+            with open(path, 'wb') as shard_file:
+                file.seek(start)
+                shard_file.write(file.read(end - start))
+            paths.append(path)
+            start = end
+    return paths
+
+
+def get_blast_command(query, database, output, program='blastn',
+                      threads=1, binary='blastall'):
+    """ Creates the blastall command for a single query file, with
+    tabular (-m8) output.
+
+    Returns:
+        A list with the arguments of the command.
+    """
+    command = [binary, '-i', query, '-d', database, '-p', program,
+               '-o', output, '-m8']
+    if threads > 1 and binary in THREAD_OPTIONS:
+        command += [THREAD_OPTIONS[binary], str(threads)]
+    return command
+
+
+def merge_outputs(paths, output):
+    """ Joins the tabular outputs of the shards in the order of the
+    shards. The output is replaced at once, so it is never incomplete.
+
+    Parameters:
+        paths - list. The output files of the shards.
+        output - string. The path of the merged output.
+    """
+    with open(output + '.tmp', 'wb') as merged:
+        for path in paths:
+            with open(path, 'rb') as file:
+                copyfileobj(file, merged)
+    os.rename(output + '.tmp', output)
+
+
+def run_blast(query, database, output, program='blastn', shards=None,
+              threads=None):
+    """ BLASTs the query FASTA file against the database. The database
+    is formatted first when needed. The queries are split into shards
+    which run at the same time, each with its own blastall process. The
+    results are merged in the order of the queries, so the output is
+    the same as that of a single blastall run.
+
+    Parameters:
+        query - string. The path of the FASTA file with the queries.
+        database - string. The path of the FASTA file of the database.
+        output - string. The path to write the tabular output to.
+        program - string. The BLAST program, like 'blastn'.
+        shards - int. The amount of shards. Defaults to the amount of
+        processors.
+        threads - int. The amount of threads of every blastall process.
+        Defaults to dividing the processors over the shards.
+    Returns:
+        Nothing
+    """
+    format_database(database)
+    processors = cpu_count()
+    directory = mkdtemp(prefix='blast_',
+                        dir=os.path.dirname(os.path.abspath(output)))
+    try:
+        shard_paths = split_fasta(query, shards or processors, directory)
+        if threads is None:
+            threads = max(1, processors // max(1, len(shard_paths)))
+        output_paths = [path[:-len('.fa')] + '.m8' for path in shard_paths]
+
+        def run_shard(paths):
+            check_call(get_blast_command(paths[0], database, paths[1],
+                                         program, threads))
+
+        fetch_all(run_shard, list(zip(shard_paths, output_paths)),
+                  len(shard_paths))
+        merge_outputs(output_paths, output)
+    finally:
+        rmtree(directory)
+
+
+if __name__ == '__main__':
+    run_blast(argv[1], argv[2], argv[3])
@@ -0,0 +1,150 @@
+from collections import OrderedDict, namedtuple
+from sys import argv
+
+from download import EFETCH_BATCH_SIZE
+from utils import open_url, fetch_all
+
+# The columns of the tabular (-m8) BLAST output
+Hit = namedtuple('Hit', ('query', 'subject', 'identity', 'length',
+                         'mismatches', 'gap_opens', 'query_start',
+                         'query_end', 'subject_start', 'subject_end',
+                         'evalue', 'bitscore'))
+_COLUMN_TYPES = (str, str, float, int, int, int, int, int, int, int, float,
+                 float)
+
+# The ways to rank the hits of a query. Every key returns a tuple of
+# which the highest is the best hit, the later values break ties. When
+# hits are still tied, the first hit in the file wins.
+SELECTION_KEYS = {
+    'bitscore': lambda hit: (hit.bitscore, -hit.evalue, hit.identity),
+    'evalue': lambda hit: (-hit.evalue, hit.bitscore, hit.identity),
+    'identity': lambda hit: (hit.identity, hit.bitscore, -hit.evalue)
+}
+
+EFETCH_FASTA_URL = 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/' \
+                   'efetch.fcgi?db=protein&id={}&rettype=fasta&showgi=1'
+
+
+def read_hits(file):
+    """ Reads the hits of a tabular (-m8) BLAST output lazily, so the
+    file is never read into memory completely. Comment lines and empty
+    lines are skipped.
+
+    Parameters:
+        file - File like object. The BLAST output, opened in text mode.
+    Returns:
+        A generator which yields a Hit for every line.
+    """
+    for line in file:
+        if not line.strip() or line.startswith('#'):
+            continue
+        values = line.rstrip('\r\n').split('\t')
+        yield Hit(*[convert(value) for convert, value in
+                    zip(_COLUMN_TYPES, values)])
+
+
+def select_best_hits(hits, key='bitscore'):
+    """ Selects the best hit of every query. Only the best hit so far is
+    kept per query, so the memory only depends on the amount of queries.
+
+    Parameters:
+        hits - iterable. Hit objects, like the result of read_hits.
+        key - string or callable. A name of SELECTION_KEYS, or a
+        function which returns the rank of a hit (highest is best).
+    Returns:
+        An OrderedDict with the queries as keys, in the order they were
+        first seen, and their best Hit as values.
+    """
+    rank = SELECTION_KEYS[key] if key in SELECTION_KEYS else key
+    best = OrderedDict()
+    best_ranks = {}
+    for hit in hits:
+        hit_rank = rank(hit)
+        if hit.query not in best or hit_rank > best_ranks[hit.query]:
+            best[hit.query] = hit
+            best_ranks[hit.query] = hit_rank
+    return best
+
+
+def group_by_subject(best_hits):
+    """ Groups the queries by the subject of their best hit.
+
+    Parameters:
+        best_hits - dictionary. The best hits generated by
+        select_best_hits.
+    Returns:
+        An OrderedDict with the subjects as keys, sorted, and a list of
+        queries as values.
+    """
+    subjects = {}
+    for query, hit in best_hits.items():
+        subjects.setdefault(hit.subject, []).append(query)
+    return OrderedDict((subject, subjects[subject])
+                       for subject in sorted(subjects))
+
+
+def _get_gi_chunk(accessions):
+    """ Retrieves the GI codes of multiple accessions from the headers
+    of a FASTA efetch request.
+
+    Returns:
+        A list of tuples with the accession and the GI code.
+    """
+    connection = open_url(EFETCH_FASTA_URL.format(','.join(accessions)))
+    gi_codes = []
+    for line in connection:
+        if line.startswith(b'>'):
+            # The identifier looks like gi|123|ref|XP_006025343.1|
+            parts = line[1:].decode().split(None, 1)[0].split('|')
+            if len(parts) >= 4 and parts[0] == 'gi':
+                gi_codes.append((parts[3], parts[1]))
+    connection.close()
+    return gi_codes
+
+
+def get_gi_codes(accessions, batch_size=EFETCH_BATCH_SIZE, workers=1):
+    """ Retrieves the GI codes of the accessions in batches.
+
+    Parameters:
+        accessions - iterable. The accessions.
+        batch_size - int. The amount of accessions per request.
+        workers - int. The amount of requests which may run at the same
+        time.
+    Returns:
+        A dictionary with the accessions as keys and the GI codes as
+        values. Accessions without a GI code are left out.
+    """
+    accessions = list(accessions)
+    chunks = [accessions[i:i + batch_size]
+              for i in range(0, len(accessions), batch_size)]
+    gi_codes = {}
+    for rows in fetch_all(_get_gi_chunk, chunks, workers):
+        gi_codes.update(rows)
+    return gi_codes
+
+
+def write_genecodes(blast_output, path='outputs/genecodes', key='bitscore'):
+    """ Creates the genecodes file out of a tabular BLAST output. Every
+    line contains an accession, its GI code and the comma separated
+    queries which have the accession as best hit. This replaces the
+    awk and sort commands of 'deelopdracht B.sh'.
+
+    Parameters:
+        blast_output - string. The path of the tabular BLAST output.
+        path - string. The path of the genecodes file.
+        key - string or callable. How the best hit is selected, see
+        select_best_hits.
+    Returns:
+        Nothing
+    """
+    with open(blast_output, 'r') as file:
+        subjects = group_by_subject(select_best_hits(read_hits(file), key))
+    gi_codes = get_gi_codes(subjects)
+    with open(path, 'w') as file:
+        for subject in subjects:
+            file.write('{} {} {}\n'.format(subject, gi_codes.get(subject, ''),
+                                           ','.join(subjects[subject])))
+
+
+if __name__ == '__main__':
+    write_genecodes(argv[1], argv[2], *argv[3:4])
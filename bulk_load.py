@@ -0,0 +1,251 @@
+import psycopg2
+from binascii import hexlify
+from itertools import islice
+from time import time
+from metrics import get_metrics
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+# The columns of every table in the order they are written to the
+# database. Columns which are not in the rows (like SERIAL keys) are
+# left out of the COPY.
+TABLE_COLUMNS = {
+    'Gen_07': ('gen_id', 'gen_naam', 'accession_code', 'gen_sequentie',
+               'gen_sequentie_2bit'),
+    'Exon_07': ('exon_id', 'gen_id', 'start_positie', 'eind_positie',
+                'complement'),
+    'Eiwit_07': ('eiwit_id', 'gen_id', 'eiwit_naam', 'eiwit_sequentie'),
+    'Reactie_07': ('reactie_id', 'reactie', 'reactie_ec'),
+    'Pathway_07': ('pathway_id', 'pathway_naam', 'class'),
+    'EiwitPathway_07': ('eiwit_id', 'pathway_id'),
+    'EiwitReactie_07': ('eiwit_id', 'reactie_id'),
+    'Referentie_07': ('referentie_id', 'pathway_id', 'titel', 'journal'),
+    'Auteur_07': ('auteur_id', 'auteur_naam'),
+    'ReferentieAuteur_07': ('auteur_id', 'referentie_id'),
+    'Domein_07': ('domein_id', 'domein_naam', 'gem_domein_lengte',
+                  'gem_alignment_coverage', 'gem_sequentie_coverage'),
+    'EiwitDomein_07': ('eiwit_id', 'domein_id')
+}
+
+# The amount of rows which are sent to the database at once
+COPY_CHUNK_SIZE = 5000
+VALUES_CHUNK_SIZE = 500
+# The errors of servers which do not support COPY FROM STDIN, only on
+# these the rows are inserted with VALUES instead. Errors in the data
+# itself, like a DataError or IntegrityError, are raised.
+COPY_UNSUPPORTED_ERRORS = (psycopg2.NotSupportedError,
+                           psycopg2.ProgrammingError)
+
+# Characters which have to be escaped in the text format of COPY
+_COPY_ESCAPES = (('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'),
+                 ('\r', '\\r'))
+# The values which are written as BYTEA
+_BINARY_TYPES = (bytearray, memoryview) if bytes is str \
+    else (bytes, bytearray, memoryview)
+
+
+def get_columns(table, row):
+    """ Retrieves the columns of the table which are used in the row,
+    in the fixed order of TABLE_COLUMNS.
+
+    Parameters:
+        table - string. The name of the table.
+        row - dictionary. A row with column names as keys.
+    Returns:
+        A tuple with the column names.
+    """
+    if table not in TABLE_COLUMNS:
+        raise ValueError('Unknown table: ' + table)
+    unknown = set(row) - set(TABLE_COLUMNS[table])
+    if unknown:
+        raise ValueError('Unknown columns for {}: {}'
+                         .format(table, ', '.join(sorted(unknown))))
+    return tuple(column for column in TABLE_COLUMNS[table] if column in row)
+
+
+def format_copy_value(value):
+    """ Formats a value for the text format of COPY.
+
+    Parameters:
+        value - Any value which can be inserted.
+    Returns:
+        The value as escaped string.
+    """
+    if value is None:
+        return '\\N'
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    if isinstance(value, _BINARY_TYPES):
+        # The hex format of BYTEA, with the backslash escaped
+        return '\\\\x' + hexlify(value).decode()
+    value = str(value)
+    for char, escaped in _COPY_ESCAPES:
+        if char in value:
+            value = value.replace(char, escaped)
+    return value
+
+
+def copy_rows(cursor, table, columns, rows):
+    """ Sends the rows to the table with a single COPY FROM STDIN.
+
+    Parameters:
+        cursor - Cursor object. The cursor to execute the COPY with.
+        table - string. The table name to insert into.
+        columns - tuple. The columns to fill.
+        rows - list. A list of dictionaries which represent rows.
+    """
+    buffer = StringIO()
+    for row in rows:
+        buffer.write('\t'.join([format_copy_value(row.get(column))
+                                for column in columns]))
+        buffer.write('\n')
+    buffer.seek(0)
+    cursor.copy_expert('COPY {} ({}) FROM STDIN'
+                       .format(table, ', '.join(columns)), buffer)
+
+
+def insert_values(cursor, table, columns, rows):
+    """ Inserts the rows with multi-row VALUES statements. This is the
+    fallback when COPY is not available.
+
+    Parameters:
+        cursor - Cursor object. The cursor to execute the queries with.
+        table - string. The table name to insert into.
+        columns - tuple. The columns to fill.
+        rows - list. A list of dictionaries which represent rows.
+    """
+    holders = '({})'.format(', '.join(['%s'] * len(columns)))
+    for start in range(0, len(rows), VALUES_CHUNK_SIZE):
+        chunk = rows[start:start + VALUES_CHUNK_SIZE]
+        values = []
+        for row in chunk:
+            values.extend(row.get(column) for column in columns)
+        cursor.execute('INSERT INTO {} ({}) VALUES {};'.format(
+            table, ', '.join(columns), ', '.join([holders] * len(chunk))),
+            values)
+
+
+def load_rows(cursor, table, rows, chunk_size=COPY_CHUNK_SIZE):
+    """ Loads all rows into the table. The rows are streamed in chunks
+    with COPY, so only a single chunk is held in memory at once. When
+    COPY fails, the chunk is rolled back to a savepoint and the
+    remaining rows are inserted with multi-row VALUES statements.
+
+    Parameters:
+        cursor - Cursor object. The cursor to execute queries with.
+        table - string. The table name to insert into.
+        rows - iterable. Dictionaries which represent rows. Every row
+        must have the same columns.
+        chunk_size - int. The amount of rows in a single COPY.
+    Returns:
+        The amount of inserted rows.
+    """
+    return _load(cursor, table, table, rows, chunk_size)[0]
+
+
+def _load(cursor, table, target, rows, chunk_size):
+    """ Loads the rows of the table into the target table, see
+    load_rows.
+
+    Returns:
+        The amount of inserted rows and the used columns.
+    """
+    start = time()
+    rows = iter(rows)
+    chunk = list(islice(rows, chunk_size))
+    if not chunk:
+        return 0, ()
+    columns = get_columns(table, chunk[0])
+    use_copy = hasattr(cursor, 'copy_expert')
+    count = 0
+    while chunk:
+        if use_copy:
+            cursor.execute('SAVEPOINT bulk_load;')
+            try:
+                copy_rows(cursor, target, columns, chunk)
+            except COPY_UNSUPPORTED_ERRORS:
+                cursor.execute('ROLLBACK TO SAVEPOINT bulk_load;')
+                use_copy = False
+            else:
+                cursor.execute('RELEASE SAVEPOINT bulk_load;')
+        if not use_copy:
+            insert_values(cursor, target, columns, chunk)
+        count += len(chunk)
+        chunk = list(islice(rows, chunk_size))
+    get_metrics().record_rows(table, count, time() - start)
+    return count, columns
+
+
+def upsert_rows(cursor, table, rows, keys, update=True,
+                chunk_size=COPY_CHUNK_SIZE):
+    """ Inserts the rows, or updates the existing rows with the same
+    keys. The rows are loaded into a temporary table with load_rows
+    first and then merged into the table with a single statement. Of
+    the rows with the same keys, the last one is used.
+
+    Parameters:
+        cursor - Cursor object. The cursor to execute queries with.
+        table - string. The table name to insert into.
+        rows - iterable. Dictionaries which represent rows.
+        keys - tuple. The columns of a unique constraint of the table.
+        update - boolean. Whether existing rows are updated. When
+        False, existing rows are kept as they are.
+        chunk_size - int. The amount of rows in a single COPY.
+    Returns:
+        The amount of rows which were offered.
+    """
+    temp = 'upsert_' + table.lower()
+    # The serial column numbers the rows in the order they are loaded
+    cursor.execute('CREATE TEMP TABLE {} (LIKE {}, upsert_order BIGSERIAL) '
+                   'ON COMMIT DROP;'.format(temp, table))
+    count, columns = _load(cursor, table, temp, rows, chunk_size)
+    if count:
+        updated = [column for column in columns if column not in keys]
+        if update and updated:
+            action = 'UPDATE SET ' + ', '.join(
+                '{0} = EXCLUDED.{0}'.format(column) for column in updated)
+        else:
+            action = 'NOTHING'
+        # A key may only be merged once per statement, the last row
+        # with the key wins
+        cursor.execute(
+            'INSERT INTO {0} ({1}) SELECT DISTINCT ON ({2}) {1} FROM {3} '
+            'ORDER BY {2}, upsert_order DESC ON CONFLICT ({2}) DO {4};'
+            .format(table, ', '.join(columns), ', '.join(keys), temp,
+                    action))
+    cursor.execute('DROP TABLE {};'.format(temp))
+    return count
+
+
+def delete_rows(cursor, table, column, values):
+    """ Deletes all rows of which the column has one of the values.
+
+    Parameters:
+        cursor - Cursor object. The cursor to execute queries with.
+        table - string. The table name to delete from.
+        column - string. The column to compare.
+        values - iterable. The values to delete, compared as text.
+    """
+    values = [str(value) for value in values]
+    if values:
+        cursor.execute('DELETE FROM {} WHERE {}::text = ANY(%s);'
+                       .format(table, column), (values,))
+
+
+def reset_sequence(cursor, table, column):
+    """ Moves the sequence of a SERIAL column past the highest stored
+    value. This is needed after rows have been inserted with explicit
+    values for the column.
+
+    Parameters:
+        cursor - Cursor object. The cursor to execute queries with.
+        table - string. The table with the SERIAL column.
+        column - string. The SERIAL column.
+    """
+    cursor.execute("SELECT setval(pg_get_serial_sequence('{0}', '{1}'), "
+                   "COALESCE(MAX({1}), 0) + 1, false) FROM {0};"
+                   .format(table, column))
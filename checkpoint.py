@@ -0,0 +1,194 @@
+import os
+from collections import OrderedDict
+from json import dumps, loads
+from threading import Lock
+
+from metrics import get_metrics
+
+
+class StageProgress(object):
+    """ The partial results of a stage which has not been completed.
+    Every finished item is appended as a JSON line to a file and
+    flushed immediately, so after a crash only the items which were
+    being processed are lost.
+    """
+
+    def __init__(self, path):
+        """ Loads the items which have already been finished.
+
+        Parameters:
+            path - string. The path of the progress file.
+        """
+        self.path = path
+        self._items = {}
+        self._lock = Lock()
+        if os.path.exists(path):
+            with open(path, 'r') as file:
+                for line in file:
+                    try:
+                        key, value = loads(line,
+                                           object_pairs_hook=OrderedDict)
+                    except ValueError:
+                        # The last line was not written completely
+                        break
+                    self._items[key] = value
+
+    def record(self, key, value):
+        """ Stores the result of a finished item.
+
+        Parameters:
+            key - string. The key of the item.
+            value - Any JSON serializable value.
+        """
+        line = dumps([key, value]) + '\n'
+        with self._lock:
+            with open(self.path, 'a') as file:
+                file.write(line)
+                file.flush()
+                os.fsync(file.fileno())
+            self._items[key] = value
+
+    def get(self, key, default=None):
+        return self._items.get(key, default)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __getitem__(self, key):
+        return self._items[key]
+
+    def __len__(self):
+        return len(self._items)
+
+
+class Checkpoint(object):
+    """ Stores the output of every stage of the load pipeline in a
+    directory, so a restarted run can skip the completed stages and
+    resume the partial ones. A completed stage is stored as a JSON
+    file, a partial stage as a StageProgress file.
+    """
+
+    def __init__(self, directory):
+        """ Creates the checkpoint directory when it does not exist.
+
+        Parameters:
+            directory - string. The directory to store the stages in.
+        """
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, stage, extension):
+        return os.path.join(self.directory, stage + extension)
+
+    def is_done(self, stage):
+        """ Checks whether the stage has been completed."""
+        return os.path.exists(self._path(stage, '.json'))
+
+    def load(self, stage):
+        """ Loads the output of a completed stage.
+
+        Parameters:
+            stage - string. The name of the stage.
+        Returns:
+            The output which was passed to save. Note that tuples are
+            loaded as lists.
+        """
+        with open(self._path(stage, '.json'), 'r') as file:
+            return loads(file.read(), object_pairs_hook=OrderedDict)
+
+    def save(self, stage, output=True):
+        """ Marks the stage as completed and stores its output. The
+        partial results of the stage are removed.
+
+        Parameters:
+            stage - string. The name of the stage.
+            output - Any JSON serializable value.
+        """
+        path = self._path(stage, '.json')
+        # Write to a temporary file first, a half written file would
+        # mark the stage as completed
+        with open(path + '.tmp', 'w') as file:
+            file.write(dumps(output))
+            file.flush()
+            os.fsync(file.fileno())
+        os.rename(path + '.tmp', path)
+        progress = self._path(stage, '.progress')
+        if os.path.exists(progress):
+            os.remove(progress)
+
+    def progress(self, stage):
+        """ Retrieves the partial results of the stage.
+
+        Parameters:
+            stage - string. The name of the stage.
+        Returns:
+            A StageProgress object.
+        """
+        return StageProgress(self._path(stage, '.progress'))
+
+    def clear(self):
+        """ Removes all stages, so the next run starts from scratch."""
+        for name in os.listdir(self.directory):
+            if name.endswith(('.json', '.progress', '.tmp')):
+                os.remove(os.path.join(self.directory, name))
+
+
+def run_stage(checkpoint, stage, function, *args, **kwargs):
+    """ Runs the function of a stage, unless the stage has already been
+    completed. In that case the stored output is returned. The function
+    must accept a progress keyword argument, which receives the
+    StageProgress of the stage. The wall time of the stage is recorded in
+    the metrics.
+
+    Parameters:
+        checkpoint - Checkpoint object or None. When None, the function
+        is simply called.
+        stage - string. The name of the stage.
+        function - callable. The function which executes the stage.
+        args, kwargs - The arguments of the function.
+    Returns:
+        The output of the stage.
+    """
+    with get_metrics().stage(stage):
+        if checkpoint is None:
+            return function(*args, **kwargs)
+        if checkpoint.is_done(stage):
+            return checkpoint.load(stage)
+        kwargs['progress'] = checkpoint.progress(stage)
+        output = function(*args, **kwargs)
+        checkpoint.save(stage, output)
+        return output
+
+
+def resume_map(function, items, progress=None, batch_size=100):
+    """ Processes the items in batches and records the result of every
+    item in the progress, so items which were finished before are
+    skipped.
+
+    Parameters:
+        function - callable. Receives a list of items and returns a
+        list with a result for each item, in the same order.
+        items - iterable. The items to process. Their string value is
+        used as key in the progress.
+        progress - StageProgress object or None.
+        batch_size - int. The amount of items in a single call of the
+        function.
+    Returns:
+        A dictionary with the items as keys and their results as
+        values.
+    """
+    results = {}
+    pending = []
+    for item in OrderedDict.fromkeys(items):
+        if progress is not None and str(item) in progress:
+            results[item] = progress[str(item)]
+        else:
+            pending.append(item)
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        for item, result in zip(batch, function(batch)):
+            if progress is not None:
+                progress.record(str(item), result)
+            results[item] = result
+    return results
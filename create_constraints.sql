@@ -0,0 +1,56 @@
+-- The keys and indexes of the tables of create_table.sql. These are
+-- added after the bulk load, so the load does not have to check them
+-- for every row.
+
+-- Primary keys
+ALTER TABLE Gen_07 ADD PRIMARY KEY (gen_id);
+ALTER TABLE Exon_07 ADD PRIMARY KEY (exon_id);
+ALTER TABLE Eiwit_07 ADD PRIMARY KEY (eiwit_id);
+ALTER TABLE Reactie_07 ADD PRIMARY KEY (reactie_id);
+ALTER TABLE Pathway_07 ADD PRIMARY KEY (pathway_id);
+ALTER TABLE Referentie_07 ADD PRIMARY KEY (referentie_id);
+ALTER TABLE Auteur_07 ADD PRIMARY KEY (auteur_id);
+ALTER TABLE Domein_07 ADD PRIMARY KEY (domein_id);
+
+-- A protein is linked to a pathway, reaction or domain only once, and
+-- an author to a reference only once
+ALTER TABLE EiwitPathway_07 ADD PRIMARY KEY (eiwit_id, pathway_id);
+ALTER TABLE EiwitReactie_07 ADD PRIMARY KEY (eiwit_id, reactie_id);
+ALTER TABLE ReferentieAuteur_07 ADD PRIMARY KEY (referentie_id, auteur_id);
+ALTER TABLE EiwitDomein_07 ADD PRIMARY KEY (eiwit_id, domein_id);
+
+-- The names which identify a row
+ALTER TABLE Gen_07 ADD UNIQUE (accession_code);
+ALTER TABLE Auteur_07 ADD UNIQUE (auteur_naam);
+ALTER TABLE Domein_07 ADD UNIQUE (domein_naam);
+
+-- Foreign keys
+ALTER TABLE Exon_07 ADD FOREIGN KEY (gen_id) REFERENCES Gen_07(gen_id);
+ALTER TABLE Eiwit_07 ADD FOREIGN KEY (gen_id) REFERENCES Gen_07(gen_id);
+ALTER TABLE EiwitPathway_07
+  ADD FOREIGN KEY (eiwit_id) REFERENCES Eiwit_07(eiwit_id),
+  ADD FOREIGN KEY (pathway_id) REFERENCES Pathway_07(pathway_id);
+ALTER TABLE EiwitReactie_07
+  ADD FOREIGN KEY (eiwit_id) REFERENCES Eiwit_07(eiwit_id),
+  ADD FOREIGN KEY (reactie_id) REFERENCES Reactie_07(reactie_id);
+ALTER TABLE Referentie_07
+  ADD FOREIGN KEY (pathway_id) REFERENCES Pathway_07(pathway_id);
+ALTER TABLE ReferentieAuteur_07
+  ADD FOREIGN KEY (auteur_id) REFERENCES Auteur_07(auteur_id),
+  ADD FOREIGN KEY (referentie_id) REFERENCES Referentie_07(referentie_id);
+ALTER TABLE EiwitDomein_07
+  ADD FOREIGN KEY (eiwit_id) REFERENCES Eiwit_07(eiwit_id),
+  ADD FOREIGN KEY (domein_id) REFERENCES Domein_07(domein_id);
+
+-- The foreign key columns which are not the first column of a key.
+-- The junction indexes also contain the other column, so joins in
+-- both directions can be answered from the index alone.
+CREATE INDEX ON Exon_07 (gen_id);
+CREATE INDEX ON Eiwit_07 (gen_id);
+CREATE INDEX ON Referentie_07 (pathway_id);
+CREATE INDEX ON EiwitPathway_07 (pathway_id, eiwit_id);
+CREATE INDEX ON EiwitReactie_07 (reactie_id, eiwit_id);
+CREATE INDEX ON ReferentieAuteur_07 (auteur_id, referentie_id);
+CREATE INDEX ON EiwitDomein_07 (domein_id, eiwit_id);
+
+ANALYZE;
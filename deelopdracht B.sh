@@ -1,68 +1,32 @@
 #!/bin/bash
+# Stop at the first failing command, so insert_data.py does not
+# continue with missing or partial BLAST output
+set -e
 
 # Set the working directory to a new directory to have the overview
-mkdir outputs
+mkdir -p outputs
 cd outputs
 
 # Assignment 3B
 
-# Retrieve the genome transcript in FASTA format of Alligator Sinensis
-wget -q "ftp://ftp.ncbi.nlm.nih.gov/genomes/all/GCF_000455745.1_ASM45574v1/GCF_000455745.1_ASM45574v1_rna.fna.gz" -O alligator_sinensis_cds.fa.gz
-gunzip alligator_sinensis_cds.fa.gz
-# Create the database and BLAST our sequences against it
-formatdb -i alligator_sinensis_cds.fa -pF
-blastall -i ../sequentie.fa -d alligator_sinensis_cds.fa -p blastn -o out_sequentie_blast.txt -m8
-# Retrieve the first hit of the BLAST from each of our sequence
-# Then link a sequence name with an accession
-# Finally link the genecodes with accessions and write it to the file 'genecodes'
-awk 'BEGIN { last = ""; } { if ($1 != last) { last = $1; print $1 "\t" $2; }}' out_sequentie_blast.txt | sort -k2 | awk '
-BEGIN {
-	geneList = "";
-	last = "";
-}
-{
-	if (seqs[$2] == "") {
-		seqs[$2] = $1
-	} else {
-		seqs[$2] = seqs[$2] "," $1
-	}
-	if ($2 != last) {
-		last = $2;
-		geneList = geneList "," $2	
-	}
-}
-END {
-	geneList = substr(geneList, 2, length(geneList) - 1);
-	system("wget -qO- \"https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=protein&id=" geneList "&rettype=fasta&showgi=1\" | egrep ^\\> | cut -c5- | sed \"s/|ref|/ /g\" | tr -d \"|\" > output")
-	while ((getline line < "output") > 0) {
-		spaceIndex = index(line, " ");		
-		geneId = substr(line, 1, spaceIndex - 1);
-		remainingLine = substr(line, spaceIndex + 1, length(line) - spaceIndex - 1)
-		key = substr(remainingLine, 1, index(remainingLine, " ") - 1)
-		geneIds[key] = geneId;	 
-	}	
-	system("rm output")
-	for (key in seqs) {
-		print key " " geneIds[key] " " seqs[key];
-	}
-}' > genecodes
+# Retrieve the genome transcript in FASTA format of Alligator Sinensis.
+# An existing transcript is kept, so its modification time stays the
+# same and blast.py can reuse the formatted database. It is written to
+# a temporary file first, so an interrupted run does not leave a
+# partial transcript behind.
+if [ ! -s alligator_sinensis_cds.fa ]; then
+    wget -q "ftp://ftp.ncbi.nlm.nih.gov/genomes/all/GCF_000455745.1_ASM45574v1/GCF_000455745.1_ASM45574v1_rna.fna.gz" -O alligator_sinensis_cds.fa.gz
+    gunzip -c alligator_sinensis_cds.fa.gz > alligator_sinensis_cds.fa.part
+    mv alligator_sinensis_cds.fa.part alligator_sinensis_cds.fa
+    rm -f alligator_sinensis_cds.fa.gz
+fi
+# Create the database and BLAST our sequences against it, the
+# sequences are split into shards which are BLASTed in parallel
+python ../blast.py ../sequentie.fa alligator_sinensis_cds.fa out_sequentie_blast.txt
+# Retrieve the best hit of each of our sequences, link the sequences
+# with an accession and the accessions with genecodes, and write it to
+# the file 'genecodes'
+python ../blast_hits.py out_sequentie_blast.txt genecodes
 
 # Assignment 4B
-# Create a directory where our protein genbank files are going to be stored
-cd ..
-mkdir protein_genbank_files
-
-for accession in $(awk '{print $1}' outputs/genecodes)
-do
-	# Download the genbank file for proteins
-	wget -qO "protein_genbank_files/$accession.gb" "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=protein&id=$accession&rettype=gb&showgi=1"
-	# Parse the name of the product
-	product=$(cat "protein_genbank_files/$accession.gb" | grep -Pzo "(?s)product=\".*?\"" | tr -d '[\n"]' | tr -s ' ' | cut -c9-)
-	# Parse the GI code (protein code)
-	gi=$(cat "protein_genbank_files/$accession.gb" | grep -Pzo "(?s)db_xref=\"GI:.*?\"" | sed 's/GI://' | tr -d '"' | cut -c9-)
-	if [[ $gi == "" ]]; then
-		gi="-"
-	fi
-	echo "$accession $gi $product" >> outputs/proteincodes
-done
-
+# The protein genbank files are downloaded in batches by download.py
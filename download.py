@@ -0,0 +1,156 @@
+import os
+from io import BytesIO
+
+from checkpoint import resume_map
+from genbank_parser import parse_genbank, split_genbank_records
+from utils import open_url
+
+# The NCBI E-utilities url to download GenBank files with and the amount
+# of accessions which are requested at once
+EFETCH_URL = 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi' \
+             '?db=protein&id={}&rettype=gb&showgi=1'
+EFETCH_BATCH_SIZE = 200
+
+
+def read_accessions(path='outputs/genecodes'):
+    """ Reads the accessions from the first column of the genecodes
+    file.
+
+    Parameters:
+        path - string. The path of the genecodes file.
+    Returns:
+        A list with the accessions in the order of the file.
+    """
+    with open(path, 'r') as file:
+        return [line.split()[0] for line in file if line.strip()]
+
+
+def get_protein_info(record):
+    """ Retrieves the GI code of the protein and the name of its product
+    from a GenBank record. Both are taken from the first feature which
+    has them.
+
+    Parameters:
+        record - dictionary. A record generated by parse_genbank.
+    Returns:
+        A tuple with the GI code ('-' when it is not available) and the
+        product name (an empty string when it is not available).
+    """
+    gi, product = '-', ''
+    for feature in record['features']:
+        qualifiers = feature['qualifiers']
+        if not product and qualifiers.get('product'):
+            product = ' '.join(qualifiers['product'][0].split())
+        if gi == '-':
+            for db_xref in qualifiers.get('db_xref', ()):
+                if db_xref and db_xref.startswith('GI:'):
+                    gi = db_xref[3:]
+                    break
+    return gi, product
+
+
+def _match_records(accessions, records):
+    """ Links the requested accessions to the returned records. An
+    accession matches the versioned accession, the accession or the
+    locus name of a record.
+
+    Parameters:
+        accessions - list. The requested accessions.
+        records - list. Tuples with the raw record and the parsed
+        record.
+    Returns:
+        A dictionary with the accessions as keys and the tuples as
+        values. Accessions without a record are left out.
+    """
+    by_name = {}
+    for raw, record in records:
+        for name in (record['version'], record['accession'],
+                     record['locus']):
+            if name:
+                by_name.setdefault(name, (raw, record))
+    matched = {}
+    for accession in accessions:
+        for name in (accession, accession.split('.')[0]):
+            if name in by_name:
+                matched[accession] = by_name[name]
+                break
+    return matched
+
+
+def fetch_genbank_batch(accessions):
+    """ Downloads the GenBank files of multiple accessions with a single
+    efetch request.
+
+    Parameters:
+        accessions - list. The accessions to download.
+    Returns:
+        A dictionary with the accessions as keys and tuples with the raw
+        record (bytes) and the parsed record as values. Accessions which
+        were not returned are left out.
+    """
+    connection = open_url(EFETCH_URL.format(','.join(accessions)))
+    records = []
+    for raw in split_genbank_records(connection):
+        for record in parse_genbank(BytesIO(raw), read_sequence=False):
+            records.append((raw, record))
+    connection.close()
+    return _match_records(accessions, records)
+
+
+def download_genbank_files(accessions, directory='protein_genbank_files',
+                           proteincodes_path='outputs/proteincodes',
+                           batch_size=EFETCH_BATCH_SIZE, progress=None):
+    """ Downloads the GenBank file of every accession in batches and
+    stores each record in its own file, named after the accession. At
+    the same time the proteincodes file is written, which contains a
+    line with the accession, GI code and product name of each file.
+    This replaces the download loop of 'deelopdracht B.sh'.
+
+    Parameters:
+        accessions - list. The accessions to download.
+        directory - string. The directory to store the files in.
+        proteincodes_path - string. The path of the proteincodes file.
+        batch_size - int. The amount of accessions per request.
+        progress - StageProgress object. When given, every stored
+        accession is recorded in it and accessions which were stored
+        before are not downloaded again.
+    Returns:
+        A dictionary with the accessions as keys and a list with the GI
+        code and product name as values.
+    Raises:
+        ValueError - When no record is returned for an accession, also
+        when it is requested on its own. The accessions of the batch
+        are not recorded in the progress.
+    """
+    if batch_size < 1:
+        raise ValueError('The batch size must be at least 1!')
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    def store_batch(batch):
+        matched = fetch_genbank_batch(batch)
+        # A record can be left out of a large response, so the missing
+        # accessions are requested again on their own
+        for accession in batch:
+            if accession not in matched:
+                matched.update(fetch_genbank_batch([accession]))
+        missing = [accession for accession in batch
+                   if accession not in matched]
+        if missing:
+            raise ValueError('No GenBank record found for: ' +
+                             ', '.join(missing))
+        info = []
+        for accession in batch:
+            raw, record = matched[accession]
+            with open(os.path.join(directory, accession + '.gb'),
+                      'wb') as file:
+                file.write(raw)
+            info.append(list(get_protein_info(record)))
+        return info
+
+    protein_info = resume_map(store_batch, accessions, progress, batch_size)
+    with open(proteincodes_path, 'w') as file:
+        for accession in accessions:
+            gi, product = protein_info[accession]
+            file.write('{} {} {}\n'.format(accession, gi, product))
+    return protein_info
@@ -0,0 +1,96 @@
+class EntityRegistry(object):
+    """ Interns names and hands out a surrogate key for every name, in
+    constant time. The keys are consecutive integers in the order the
+    names are interned, after the highest key of the seeded names. This
+    replaces the searches in lists of stored names, and lets the keys
+    be inserted explicitly instead of relying on a SERIAL column.
+    """
+
+    def __init__(self, items=(), start=1):
+        """ Creates a registry, seeded with names which already have a
+        key.
+
+        Parameters:
+            items - iterable. Tuples with a name and its key, like the
+            rows which are already stored in the database.
+            start - int. The first key which is handed out when no
+            seeded key is higher.
+        """
+        self._keys = {}
+        self._names = []
+        self._seeded = 0
+        self.next_key = start
+        for name, key in items:
+            self.add(name, key)
+        self._seeded = len(self._names)
+
+    @classmethod
+    def from_database(cls, cursor, table, key_column, name_column):
+        """ Creates a registry seeded with the rows of a table.
+
+        Parameters:
+            cursor - Cursor object. The cursor to execute queries with.
+            table - string. The table to select from.
+            key_column - string. The column with the surrogate keys.
+            name_column - string. The column with the names.
+        Returns:
+            A new EntityRegistry.
+        """
+        cursor.execute('SELECT {}, {} FROM {} ORDER BY {};'.format(
+            name_column, key_column, table, key_column))
+        return cls(cursor.fetchall())
+
+    def add(self, name, key):
+        """ Registers a name with a known key.
+
+        Parameters:
+            name - The name, any hashable value.
+            key - int. The key of the name.
+        """
+        if name not in self._keys:
+            self._names.append(name)
+        self._keys[name] = key
+        if key >= self.next_key:
+            self.next_key = key + 1
+
+    def intern(self, name):
+        """ Retrieves the key of the name, a new key is handed out when
+        the name is not registered yet.
+
+        Parameters:
+            name - The name, any hashable value.
+        Returns:
+            The key of the name.
+        """
+        key = self._keys.get(name)
+        if key is None:
+            key = self.next_key
+            self.add(name, key)
+        return key
+
+    def get(self, name, default=None):
+        return self._keys.get(name, default)
+
+    def get_new(self):
+        """ Retrieves the names which were interned after seeding.
+
+        Returns:
+            A list of tuples with the name and its key, in the order
+            the names were interned.
+        """
+        return [(name, self._keys[name])
+                for name in self._names[self._seeded:]]
+
+    def __contains__(self, name):
+        return name in self._keys
+
+    def __getitem__(self, name):
+        return self._keys[name]
+
+    def __iter__(self):
+        """ Iterates over the names in the order they were registered.
+        """
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
@@ -0,0 +1,291 @@
+import mmap
+from collections import OrderedDict
+from io import BytesIO
+from os import fstat
+
+# The column where the values of header lines and features start
+HEADER_INDENT = 12
+FEATURE_INDENT = 21
+# Qualifiers of which the lines are joined without a space
+NO_SPACE_QUALIFIERS = ('translation',)
+# The characters which are removed from the ORIGIN lines
+SEQUENCE_NOISE = b'0123456789 \t\r\n'
+
+
+def _new_record():
+    """ Creates an empty record with all the keys which are filled by
+    parse_genbank.
+    """
+    return dict(locus='', molecule='', definition='', accession='',
+                version='', gi='', features=[], translation=None,
+                sequence='')
+
+
+def _set_header(record, keyword, value):
+    """ Stores the value of a header keyword in the record. Only the
+    keywords which are used by the scripts are stored.
+
+    Parameters:
+        record - dictionary. The record which is being parsed.
+        keyword - string. The keyword of the header, like 'DEFINITION'.
+        value - string. The complete (joined) value of the keyword.
+    """
+    if keyword == 'LOCUS':
+        values = value.split()
+        record['locus'] = values[0] if values else ''
+        # The length is followed by 'aa' for proteins and by 'bp' and
+        # the molecule type (like 'mRNA') for nucleotides
+        if len(values) > 2 and values[2] == 'aa':
+            record['molecule'] = 'protein'
+        elif len(values) > 3 and values[2] == 'bp':
+            record['molecule'] = values[3]
+    elif keyword == 'DEFINITION':
+        record['definition'] = value
+    elif keyword == 'ACCESSION':
+        record['accession'] = value.split()[0] if value else ''
+    elif keyword == 'VERSION':
+        values = value.split()
+        record['version'] = values[0] if values else ''
+        for item in values[1:]:
+            if item.startswith('GI:'):
+                record['gi'] = item[3:]
+
+
+def _add_qualifier(feature, line):
+    """ Adds a new qualifier to the feature.
+
+    Parameters:
+        feature - dictionary. The feature to add the qualifier to.
+        line - string. The qualifier line without indent, starting with
+        a '/'.
+    Returns:
+        The name of the qualifier.
+    """
+    name, _, value = line[1:].partition('=')
+    feature['qualifiers'].setdefault(name, []).append(value if _ else None)
+    return name
+
+
+def _extend_qualifier(feature, name, line):
+    """ Appends a continuation line to the last value of the
+    qualifier.
+    """
+    values = feature['qualifiers'][name]
+    separator = '' if name in NO_SPACE_QUALIFIERS else ' '
+    values[-1] += separator + line
+
+
+def _is_open(value):
+    """ Checks if a quoted qualifier value continues on the next line.
+    """
+    return value is not None and value.startswith('"') and \
+        (len(value) == 1 or not value.endswith('"'))
+
+
+def _finish_feature(feature):
+    """ Removes the quotes around the qualifier values."""
+    for values in feature['qualifiers'].values():
+        for i in range(len(values)):
+            if values[i] is not None and values[i].startswith('"'):
+                values[i] = values[i][1:-1] if values[i].endswith('"') \
+                    else values[i][1:]
+
+
+def _finish_record(record, sequence):
+    """ Completes the record after the '//' line has been read. The
+    raw ORIGIN lines are joined and stripped from the positions and
+    whitespace in a single pass.
+    """
+    for feature in record['features']:
+        _finish_feature(feature)
+    if sequence is not None:
+        record['sequence'] = b''.join(sequence).translate(
+            None, SEQUENCE_NOISE).decode()
+    for feature in record['features']:
+        if feature['key'] == 'CDS' and \
+                'translation' in feature['qualifiers']:
+            record['translation'] = feature['qualifiers']['translation'][0]
+            break
+    return record
+
+
+def parse_genbank(file, read_sequence=True):
+    """ Parses all the records of a GenBank file. The file is read only
+    once, line by line, so files with many records can be parsed
+    without reading them completely into memory.
+
+    Every record is a dictionary with the following keys:
+        locus - The name on the LOCUS line.
+        molecule - The molecule type on the LOCUS line, like 'DNA' or
+            'mRNA', or 'protein' for protein records.
+        definition - The complete DEFINITION, joined to one line.
+        accession - The (first) accession code.
+        version - The versioned accession code.
+        gi - The GI number on the VERSION line, if available.
+        features - A list of dictionaries with the keys 'key' (like
+            'CDS'), 'location' (the raw location string) and
+            'qualifiers' (an OrderedDict with the qualifier names as
+            keys and a list of values as values).
+        translation - The /translation of the first CDS which has one,
+            otherwise None.
+        sequence - The sequence of the ORIGIN.
+
+    Parameters:
+        file - File like object. The GenBank file to parse, opened in
+        text or binary mode.
+        read_sequence - boolean. Whether to collect the ORIGIN. When
+        False, the sequence of the record is an empty string.
+    Returns:
+        A generator which yields a dictionary for each record.
+    """
+    record = _new_record()
+    section = None
+    keyword, value = None, ''
+    feature, qualifier = None, None
+    sequence = [] if read_sequence else None
+    for line in file:
+        # The ORIGIN lines are kept as raw bytes
+        if section == 'origin' and not line.startswith(
+                b'//' if isinstance(line, bytes) else '//'):
+            if sequence is not None:
+                sequence.append(line if isinstance(line, bytes)
+                                else line.encode())
+            continue
+        if isinstance(line, bytes):
+            line = line.decode()
+        line = line.rstrip('\r\n')
+        if line.startswith('//'):
+            if section == 'header':
+                _set_header(record, keyword, value)
+            yield _finish_record(record, sequence)
+            record = _new_record()
+            section, keyword, value = None, None, ''
+            feature, qualifier = None, None
+            sequence = [] if read_sequence else None
+        elif line[:1].strip():
+            # A new top level keyword
+            if section == 'header':
+                _set_header(record, keyword, value)
+            keyword = line[:HEADER_INDENT].strip()
+            value = line[HEADER_INDENT:].strip()
+            if keyword == 'FEATURES':
+                section = 'features'
+            elif keyword == 'ORIGIN':
+                section = 'origin'
+            else:
+                section = 'header'
+        elif section == 'header':
+            # A continuation or sub keyword (like AUTHORS) of the
+            # header. Sub keywords are not stored.
+            if not line[:HEADER_INDENT].strip():
+                value += ' ' + line.strip()
+        elif section == 'features' and line.strip():
+            content = line[FEATURE_INDENT:].strip()
+            if line[:FEATURE_INDENT].strip():
+                # A new feature
+                feature = dict(key=line[:FEATURE_INDENT].strip(),
+                               location=content,
+                               qualifiers=OrderedDict())
+                record['features'].append(feature)
+                qualifier = None
+            elif qualifier is not None and _is_open(
+                    feature['qualifiers'][qualifier][-1]):
+                _extend_qualifier(feature, qualifier, content)
+            elif content.startswith('/'):
+                qualifier = _add_qualifier(feature, content)
+            elif qualifier is None:
+                # The location continues on the next line
+                feature['location'] += content
+    # A record without the closing '//' line
+    if section is not None:
+        if section == 'header':
+            _set_header(record, keyword, value)
+        yield _finish_record(record, sequence)
+
+
+def split_genbank_records(file):
+    """ Splits a stream with multiple GenBank records, like the
+    response of an efetch request, into the raw records. The stream is
+    read line by line.
+
+    Parameters:
+        file - File like object. The GenBank stream, opened in binary
+        mode.
+    Returns:
+        A generator which yields every record as bytes, including its
+        closing '//' line.
+    """
+    lines = []
+    for line in file:
+        # Skip the blank lines between records
+        if not lines and not line.strip():
+            continue
+        lines.append(line)
+        if line.startswith(b'//'):
+            yield b''.join(lines)
+            lines = []
+    # A record without the closing '//' line
+    if lines:
+        yield b''.join(lines)
+
+
+def extract_origin(data, start=0):
+    """ Extracts the sequence of the first ORIGIN block after the start
+    position from raw GenBank data. The block is found with a byte
+    search and the positions and whitespace are removed in bulk, so
+    this takes linear time.
+
+    Parameters:
+        data - bytes like object. The data of a GenBank file, like
+        bytes or an mmap.
+        start - int. The position to start searching from.
+    Returns:
+        The sequence as bytes. When no ORIGIN is found, empty bytes.
+    """
+    if data[start:start + 6] == b'ORIGIN':
+        origin = start
+    else:
+        origin = data.find(b'\nORIGIN', start)
+        if origin == -1:
+            return b''
+    begin = data.find(b'\n', origin + 1)
+    if begin == -1:
+        return b''
+    end = data.find(b'\n//', begin)
+    if end == -1:
+        end = len(data)
+    return data[begin:end].translate(None, SEQUENCE_NOISE)
+
+
+def read_genbank_file(path):
+    """ Parses the first record of the GenBank file. The file is memory
+    mapped once: only the header and features up to the ORIGIN are
+    parsed line by line, the ORIGIN is extracted from the same map with
+    extract_origin.
+
+    Parameters:
+        path - string. The path to the GenBank file.
+    Returns:
+        A dictionary which represents the record, see parse_genbank.
+        When the file does not contain a record, an empty record is
+        returned.
+    """
+    with open(path, 'rb') as genbank:
+        if fstat(genbank.fileno()).st_size == 0:
+            return _new_record()
+        mapped = mmap.mmap(genbank.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            end = mapped.find(b'\n//')
+            if end == -1:
+                end = len(mapped)
+            origin = mapped.find(b'\nORIGIN', 0, end)
+            header = mapped[:end if origin == -1 else origin + 1]
+            for record in parse_genbank(BytesIO(header),
+                                        read_sequence=False):
+                if origin != -1:
+                    record['sequence'] = extract_origin(
+                        mapped, origin + 1).decode()
+                return record
+        finally:
+            mapped.close()
+    return _new_record()
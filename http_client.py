@@ -0,0 +1,211 @@
+import errno
+import socket
+import zlib
+from io import BytesIO
+from threading import Lock
+try:
+    from http.client import HTTPConnection, HTTPSConnection, BadStatusLine
+    from urllib.error import HTTPError
+    from urllib.parse import urljoin, urlparse
+except ImportError:
+    from httplib import HTTPConnection, HTTPSConnection, BadStatusLine
+    from urllib2 import HTTPError
+    from urlparse import urljoin, urlparse
+
+# The time (in seconds) to wait for a connection or a response
+DEFAULT_TIMEOUT = 60
+# The amount of idle connections which are kept open per host
+DEFAULT_POOL_SIZE = 8
+# The amount of redirects which are followed for a single request
+MAX_REDIRECTS = 5
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+# The errors (numbers) which mean that a kept alive connection was
+# closed by the server in the meantime
+_STALE_ERRNOS = (errno.ECONNRESET, errno.EPIPE)
+
+
+class HTTPClient(object):
+    """ Downloads urls over persistent HTTP/1.1 connections. The idle
+    connections are kept per host, so successive requests to a host
+    reuse the same TCP (and TLS) connection. Responses are requested
+    with gzip compression and decompressed transparently. The client
+    may be used from multiple threads, every request uses a connection
+    on its own.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE,
+                 max_redirects=MAX_REDIRECTS, headers=None):
+        """ Creates a client without open connections.
+
+        Parameters:
+            timeout - number. The time in seconds to wait for a
+            connection or a response.
+            pool_size - int. The amount of idle connections which are
+            kept open per host.
+            max_redirects - int. The amount of redirects which are
+            followed.
+            headers - dictionary. Extra headers sent with every request.
+        """
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.max_redirects = max_redirects
+        self.headers = {'Accept-Encoding': 'gzip, deflate',
+                        'Connection': 'keep-alive'}
+        self.headers.update(headers or {})
+        self._idle = {}
+        self._lock = Lock()
+
+    def _get_connection(self, scheme, host):
+        """ Takes an idle connection to the host, or creates a new one.
+
+        Returns:
+            A tuple with the connection and whether it was reused.
+        """
+        with self._lock:
+            idle = self._idle.get((scheme, host))
+            if idle:
+                return idle.pop(), True
+        connection_class = HTTPSConnection if scheme == 'https' \
+            else HTTPConnection
+        return connection_class(host, timeout=self.timeout), False
+
+    def _release(self, scheme, host, connection):
+        """ Puts the connection back in the pool, or closes it when the
+        pool of the host is full.
+        """
+        with self._lock:
+            idle = self._idle.setdefault((scheme, host), [])
+            if len(idle) < self.pool_size:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def _request(self, url):
+        """ Does a single request, without following redirects. When a
+        reused connection turns out to be closed by the server (see
+        is_stale), the request is repeated on another connection.
+
+        Returns:
+            A tuple with the status code, the reason, the response
+            headers (a dictionary with lowercase names) and the decoded
+            body.
+        """
+        parsed = urlparse(url)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        while True:
+            connection, reused = self._get_connection(parsed.scheme,
+                                                      parsed.netloc)
+            try:
+                connection.request('GET', path, headers=self.headers)
+                response = connection.getresponse()
+                body = response.read()
+            except Exception as error:
+                connection.close()
+                if reused and is_stale(error):
+                    continue
+                raise
+            break
+        headers = dict((name.lower(), value)
+                       for name, value in response.getheaders())
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(parsed.scheme, parsed.netloc, connection)
+        return (response.status, response.reason, headers,
+                decode_body(body, headers))
+
+    def fetch(self, url):
+        """ Downloads the complete response of the url, following
+        redirects.
+
+        Parameters:
+            url - string. The url to download.
+        Returns:
+            The body of the response as bytes.
+        Raises:
+            HTTPError - When the server responds with an error status.
+        """
+        for _ in range(self.max_redirects + 1):
+            status, reason, headers, body = self._request(url)
+            if status in REDIRECT_CODES and 'location' in headers:
+                url = urljoin(url, headers['location'])
+                continue
+            if status >= 400:
+                raise HTTPError(url, status, reason, headers, BytesIO(body))
+            return body
+        raise HTTPError(url, status, 'Too many redirects', headers,
+                        BytesIO(body))
+
+    def open(self, url):
+        """ Downloads the url, see fetch.
+
+        Returns:
+            A file like object containing the body, which supports read
+            and readline.
+        """
+        return BytesIO(self.fetch(url))
+
+    def close(self):
+        """ Closes all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+
+def is_stale(error):
+    """ Checks whether the error means that the server closed the
+    connection before the request was sent: a closed connection without
+    a response (RemoteDisconnected or BadStatusLine), a reset or a
+    broken pipe. Other errors, like timeouts, are not retried by the
+    client but left to the retries of utils.open_url.
+    """
+    if isinstance(error, BadStatusLine):
+        return True
+    return isinstance(error, socket.error) and \
+        getattr(error, 'errno', None) in _STALE_ERRNOS
+
+
+def decode_body(body, headers):
+    """ Decompresses a body according to its Content-Encoding.
+
+    Parameters:
+        body - bytes. The raw body.
+        headers - dictionary. The response headers with lowercase names.
+    Returns:
+        The decompressed body as bytes.
+    """
+    encoding = headers.get('content-encoding', '').lower()
+    if encoding in ('gzip', 'x-gzip'):
+        return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            # Some servers send a raw deflate stream
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    return body
+
+
+_client = HTTPClient()
+
+
+def configure_client(**kwargs):
+    """ Replaces the client which is shared by all downloads in utils.
+    The keyword arguments are passed to HTTPClient.
+
+    Returns:
+        The created HTTPClient.
+    """
+    global _client
+    _client.close()
+    _client = HTTPClient(**kwargs)
+    return _client
+
+
+def get_client():
+    """ Returns the shared HTTPClient."""
+    return _client
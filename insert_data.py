@@ -1,17 +1,50 @@
 import psycopg2
+import psycopg2.pool
+from collections import OrderedDict
 from os import system
 from csv import reader
-
+from sys import argv
+
+from bulk_load import load_rows, upsert_rows, delete_rows, reset_sequence
+from checkpoint import Checkpoint, resume_map, run_stage
+from download import download_genbank_files, read_accessions
+from entity_registry import EntityRegistry
+from genbank_parser import read_genbank_file
+from metrics import enable_metrics, get_metrics
 from location_parser import parse_location, ComplementLocation, JoinedLocation
+from packed_sequence import PackedSequence, is_nucleotide
+from parallel_load import LOAD_WORKERS, ParallelLoader, read_dependencies
 from pathway_pfam import get_pathway_pfam_data
 from protein_reaction import get_reaction_data
-from utils import get_line, convert_gi_to_asn
+from queries import notify_loaded
+from response_cache import configure_cache
+from utils import convert_gis_to_asns
 
 try:
     from urllib.request import urlopen
 except ImportError:
     from urllib import urlopen
 
+# The amount of concurrent downloads used to retrieve the KEGG, Pfam
+# and genome.jp data. The limit per host is set in utils.
+FETCH_WORKERS = 8
+# The directory where all downloaded responses are cached
+CACHE_DIRECTORY = 'http_cache'
+# The amount of GI numbers converted in a single bioDBnet request
+GI_CHUNK_SIZE = 100
+# The connection parameters of the database
+DATABASE = dict(dbname="postgres", user="Bpgepr161707", password="****")
+# The directory where the output of every finished stage is stored, so
+# an interrupted run can be resumed
+CHECKPOINT_DIRECTORY = 'checkpoints'
+# The bare tables, and the keys and indexes which are added to them
+# after the first load
+SCHEMA_FILE = 'create_table.sql'
+CONSTRAINTS_FILE = 'create_constraints.sql'
+# The JSON report with the timings of the stages, the requests per host
+# and the rows per table
+METRICS_REPORT = 'metrics.json'
+
 
 def get_accession_dictionaries():
     """ Generates 3 dictionaries:
@@ -47,19 +80,30 @@ def get_accession_dictionaries():
     return acc_genecode, acc_proteincode, genecode_proteincode
 
 
-def get_gi_kegg_dictionary(proteincodes):
+def get_gi_kegg_dictionary(proteincodes, chunk_size=GI_CHUNK_SIZE,
+                           progress=None):
     """ Converts a list of proteincodes to a dictionary with
     proteincodes askeys and kegg protein codes as values.
 
     Parameters:
         proteincodes - list. A list of proteincodes.
+        chunk_size - int. The amount of proteincodes which are
+        converted in a single request.
+        progress - StageProgress object. When given, every converted
+        proteincode is recorded in it and proteincodes which were
+        converted before are skipped.
     Returns
         A dictionary containing regular proteincodes as keys and KEGG
         proteincodes as values.
     """
+    def convert_batch(codes):
+        asn_codes = convert_gis_to_asns(codes, chunk_size)
+        return [asn_codes[code] for code in codes]
+
     # Do the actual conversion from proteincode to KEGG proteincode
-    proteincode2kegg = {proteincode: convert_gi_to_asn(proteincode)
-                        for proteincode in proteincodes}
+    proteincode2kegg = resume_map(convert_batch, [str(code) for code in
+                                                  proteincodes], progress,
+                                  chunk_size)
     # Find keys which contain '-' as value
     del_keys = []
     for proteincode in proteincode2kegg:
@@ -73,7 +117,8 @@ def get_gi_kegg_dictionary(proteincodes):
 
 def insert_data(cursor, table, lst_data):
     """ Inserts data based on the table name and a list of
-    dictionaries which each represent a row.
+    dictionaries which each represent a row. The rows are streamed to
+    the database in bulk by bulk_load.load_rows.
 
     Parameters:
         cursor - Cursor object. The connection cursor which executes
@@ -84,37 +129,184 @@ def insert_data(cursor, table, lst_data):
     Return:
         Nothing.
     """
-    query = 'INSERT INTO {} ({}) VALUES ({});'
-    for query_data in lst_data:
-        # Create lists with the column names and values, so it can be
-        # formatted correctly in the query
-        columns = []
-        values = []
-        for column in query_data:
-            columns.append(column)
-            values.append(query_data[column])
-        # Generate the columns string for the query
-        columns = ", ".join(columns)
-        holders = ', '.join(['%s' for _ in range(len(values))])
-        # Execute the query with the values
-        cursor.execute(query.format(table, columns, holders), values)
-
-
-def read_sequence(file):
-    """ Reads a sequence from a file, specifically the ORIGIN.
+    load_rows(cursor, table, lst_data)
+
+
+def store_data(cursor, table, lst_data, keys, incremental, update=True):
+    """ Stores the rows in the table. When loading incrementally, the
+    rows are upserted on the given keys, otherwise they are simply
+    inserted.
+
+    Parameters:
+        cursor - Cursor object. The cursor to execute queries with.
+        table - string. The table name to insert into.
+        lst_data - list. Dictionaries which represent rows.
+        keys - tuple. The primary key columns of the table.
+        incremental - boolean. Whether the database already contains
+        data.
+        update - boolean. Whether existing rows are updated. When
+        False, existing rows are reused as they are.
+    Returns:
+        Nothing
+    """
+    if incremental:
+        upsert_rows(cursor, table, lst_data, keys, update)
+    else:
+        insert_data(cursor, table, lst_data)
+
+
+def get_existing_keys(cursor, table, column):
+    """ Retrieves all values of a column as strings.
+
+    Parameters:
+        cursor - Cursor object. The cursor to execute queries with.
+        table - string. The table to select from.
+        column - string. The column to select.
+    Returns:
+        A set with the values.
+    """
+    cursor.execute('SELECT {} FROM {};'.format(column, table))
+    return {str(row[0]).strip() for row in cursor.fetchall()}
+
+
+def get_new_entity_rows(registry, lst_data, id_column, name_column):
+    """ Selects the rows of the names which were interned in the
+    registry after it was seeded from the table, and adds their ids.
+
+    Parameters:
+        registry - EntityRegistry. The registry seeded from the table.
+        lst_data - list. Dictionaries which represent rows, without
+        the id column.
+        id_column - string. The SERIAL column.
+        name_column - string. The column with the names.
+    Returns:
+        A list with the new rows.
+    """
+    new_names = {name for name, _ in registry.get_new()}
+    return [dict(row, **{id_column: registry[row[name_column]]})
+            for row in lst_data if row[name_column] in new_names]
+
+
+def get_unique_rows(lst_data):
+    """ Removes the duplicate rows of a junction table, since the
+    combination of its columns is the primary key (see
+    create_constraints.sql).
+
+    Parameters:
+        lst_data - list. Dictionaries which represent rows.
+    Returns:
+        A list with the first occurrence of every row.
+    """
+    rows = OrderedDict()
+    for row in lst_data:
+        rows.setdefault(tuple(sorted(row.items())), row)
+    return list(rows.values())
+
+
+def create_load(table, lst_data, keys=(), incremental=False, update=True,
+                replace=None, serial=None):
+    """ Creates the function which loads the rows into a table. The
+    loads of the tables are created up front, so main can run them
+    in the order of the foreign keys (see parallel_load).
+
     Parameters:
-        file - File object.
+        table - string. The table name to insert into.
+        lst_data - list. Dictionaries which represent rows.
+        keys - tuple. The primary key columns, the rows are upserted on
+        them when loading incrementally (see store_data).
+        incremental - boolean. Whether the database already contains
+        data.
+        update - boolean. Whether existing rows are updated.
+        replace - tuple. A column and its values. When loading
+        incrementally, the stored rows with these values are deleted
+        first.
+        serial - string. A SERIAL column which is filled explicitly,
+        its sequence is moved past the inserted values.
     Returns:
-        When the origin has been found, the string of the sequence.
-        Otherwise, an empty string.
+        A function which loads the rows with the given cursor.
     """
-    get_line(file, 'ORIGIN')
-    sequence = ''
-    line = file.readline().decode()
-    while line and not line.startswith('//'):
-        sequence += ''.join(line.strip().split()[1:])
-        line = file.readline().decode()
-    return sequence
+    def load(cursor):
+        if incremental and replace is not None:
+            delete_rows(cursor, table, *replace)
+        if keys:
+            store_data(cursor, table, lst_data, keys, incremental, update)
+        else:
+            insert_data(cursor, table, lst_data)
+        if serial is not None and lst_data:
+            reset_sequence(cursor, table, serial)
+    return load
+
+
+def run_loads(cursor, loads):
+    """ Runs the loads of prepare functions one after another on a
+    single cursor.
+
+    Parameters:
+        cursor - Cursor object. The cursor to execute queries with.
+        loads - OrderedDict. The table names as keys and the loads
+        created by create_load as values, in the order of the foreign
+        keys.
+    """
+    for table in loads:
+        loads[table](cursor)
+
+
+def get_changed_accessions(cursor, accession_genecode,
+                           accession_proteincode):
+    """ Compares the accessions with the genes and proteins which are
+    stored in the database.
+
+    Parameters:
+        cursor - Cursor object. The cursor to execute queries with.
+        accession_genecode - dictionary. The accession to genecode
+        dictionary generated by get_accession_dictionaries().
+        accession_proteincode - dictionary. The accession to
+        proteincode dictionary generated by
+        get_accession_dictionaries().
+    Returns:
+        A set with the accessions which are not stored yet or which
+        are stored with another genecode or proteincode.
+    """
+    cursor.execute('SELECT g.accession_code, g.gen_id, e.eiwit_id '
+                   'FROM Gen_07 g LEFT JOIN Eiwit_07 e '
+                   'ON e.gen_id = g.gen_id;')
+    stored = {}
+    for accession, gen_id, eiwit_id in cursor.fetchall():
+        stored[accession] = (str(gen_id),
+                             '-' if eiwit_id is None else str(eiwit_id))
+    return {accession for accession in accession_genecode
+            if stored.get(accession) != (accession_genecode[accession],
+                                         accession_proteincode[accession])}
+
+
+def delete_genes(cursor, accessions, proteincodes=()):
+    """ Deletes the stored genes of the accessions, with their exons,
+    their proteins and the links of those proteins, so the changed
+    accessions can be loaded again.
+
+    Parameters:
+        cursor - Cursor object. The cursor to execute queries with.
+        accessions - iterable. The accession codes of the genes.
+        proteincodes - iterable. Other proteincodes of which the links
+        are deleted, like the new proteincodes of the accessions.
+    """
+    accessions = list(accessions)
+    proteincodes = [code for code in proteincodes if code != '-']
+    if not accessions and not proteincodes:
+        return
+    genes = 'SELECT gen_id FROM Gen_07 WHERE accession_code = ANY(%s)'
+    proteins = 'SELECT eiwit_id FROM Eiwit_07 WHERE gen_id IN ({})'.format(
+        genes)
+    for table in ('EiwitReactie_07', 'EiwitDomein_07', 'EiwitPathway_07'):
+        cursor.execute('DELETE FROM {} WHERE eiwit_id IN ({}) OR '
+                       'eiwit_id::text = ANY(%s);'.format(table, proteins),
+                       (accessions, proteincodes))
+    cursor.execute('DELETE FROM Eiwit_07 WHERE gen_id IN ({});'.format(genes),
+                   (accessions,))
+    cursor.execute('DELETE FROM Exon_07 WHERE gen_id IN ({});'.format(genes),
+                   (accessions,))
+    cursor.execute('DELETE FROM Gen_07 WHERE accession_code = ANY(%s);',
+                   (accessions,))
 
 
 def get_exon_rows(location, genecode):
@@ -153,58 +345,113 @@ def get_exon_rows(location, genecode):
     return table_data
 
 
-def insert_gene_exon(cursor, accesion_genecode):
-    """ Inserts the Gen_07 and Exon_07 tables with information they
+def read_genbank_records(accessions):
+    """ Parses the protein genbank file of every accession. Each file
+    is read only once and the records are shared by insert_gene_exon
+    and insert_protein.
+
+    Parameters:
+        accessions - iterable. The accessions of which the genbank
+        files are stored in the protein_genbank_files directory.
+    Returns:
+        A dictionary with accessions as keys and the parsed records
+        (see genbank_parser.parse_genbank) as values.
+    """
+    return {accession: read_genbank_file(
+        'protein_genbank_files/{}.gb'.format(accession))
+        for accession in accessions}
+
+
+def get_sequence_columns(record, pack=False):
+    """ Returns the sequence columns of a Gen_07 row. The sequence is
+    stored as text in gen_sequentie, unless packing is enabled and the
+    record is a nucleotide. Then it is only stored with 2 bits per base
+    in gen_sequentie_2bit and gen_sequentie is NULL, so readers of the
+    text column have to use queries (or packed_sequence) instead.
+
+    Parameters:
+        record - dictionary. The parsed genbank record.
+        pack - boolean. Whether nucleotide sequences are packed.
+    Returns:
+        A dictionary with the gen_sequentie and gen_sequentie_2bit
+        columns.
+    """
+    sequence = record['sequence'].upper()
+    if pack and is_nucleotide(record['molecule']):
+        return dict(gen_sequentie=None, gen_sequentie_2bit=PackedSequence
+                    .encode(sequence).to_bytes())
+    return dict(gen_sequentie=sequence, gen_sequentie_2bit=None)
+
+
+def prepare_gene_exon(accesion_genecode, records=None,
+                      incremental=False, pack_sequences=False):
+    """ Prepares the Gen_07 and Exon_07 tables with information they
     require.
 
     Parameters:
-        cursor - Cursor object. The cursor object which executes
-        queries.
         accesion_genecode - dictionary. The accession - genecode
         dictionary generated by get_accession_dictionaries().
+        records - dictionary. The genbank records generated by
+        read_genbank_records(). When not given, the files are read.
+        incremental - boolean. Whether the genes are upserted and their
+        old exons are replaced.
+        pack_sequences - boolean. Whether nucleotide sequences are
+        stored packed, see get_sequence_columns.
     Returns:
-        Nothing
+        An OrderedDict with the loads of the tables, see create_load.
     """
-    # First insert the literal gene information
+    if records is None:
+        records = read_genbank_records(accesion_genecode)
+    # First collect the literal gene information
     gene_data = []
     exon_data = []
     for accession in accesion_genecode:
+        record = records[accession]
+        # Use the data of the genbank record such as: name, exon
+        # locations and sequence.
         row = dict(accession_code=accession,
-                   gen_id=accesion_genecode[accession])
-        # Read data from the nucleotide genbank file such as: name,
-        # exon location and sequence.
-        path = 'protein_genbank_files/{}.gb'.format(accession)
-        with open(path, 'rb') as genbank:
-            # Get the gene name
-            definition_line = get_line(genbank, 'DEFINITION')
-            line = genbank.readline().decode()
-            while not line.startswith('ACCESSION'):
-                definition_line += ' ' + line.strip()
-                line = genbank.readline().decode()
-            row['gen_naam'] = definition_line
-            exon_line = get_line(genbank, 'CDS')
-            if exon_line:
-                exon_data.extend(get_exon_rows(exon_line, row['gen_id']))
-            # Get the DNA sequence
-            row['gen_sequentie'] = read_sequence(genbank).upper()
+                   gen_id=accesion_genecode[accession],
+                   gen_naam=record['definition'])
+        row.update(get_sequence_columns(record, pack_sequences))
+        for feature in record['features']:
+            if feature['key'] == 'CDS':
+                exon_data.extend(get_exon_rows(feature['location'],
+                                               row['gen_id']))
         gene_data.append(row)
-    # Insert data into Gen_07 and Exon_07
-    insert_data(cursor, 'Gen_07', gene_data)
-    insert_data(cursor, 'Exon_07', exon_data)
+    return OrderedDict([
+        ('Gen_07', create_load('Gen_07', gene_data, ('gen_id',),
+                               incremental)),
+        ('Exon_07', create_load('Exon_07', exon_data,
+                                incremental=incremental,
+                                replace=('gen_id',
+                                         list(accesion_genecode.values()))))
+    ])
+
+
+def insert_gene_exon(cursor, accesion_genecode, records=None,
+                     incremental=False, pack_sequences=False):
+    """ Inserts the Gen_07 and Exon_07 tables, see prepare_gene_exon.
+    """
+    run_loads(cursor, prepare_gene_exon(accesion_genecode, records,
+                                        incremental, pack_sequences))
 
 
-def insert_protein(cursor, accession_genecode, genecode_proteincode):
-    """ Inserts data to the Eiwit_07 table.
+def prepare_protein(accession_genecode, genecode_proteincode, records=None,
+                    incremental=False):
+    """ Prepares the data of the Eiwit_07 table.
     Parameters:
-        cursor - Cursor object. The cursor object which executes
-        queries.
         accession_genecode - dictionary. The accession to genecode
         dictionary generated by get_accession_dictionaries().
         genecode_proteincode - dictionary. The genecode to proteincode
         dictionary generated by get_accession_dictionaries().
+        records - dictionary. The genbank records generated by
+        read_genbank_records(). When not given, the files are read.
+        incremental - boolean. Whether the proteins are upserted.
     Returns:
-        Nothing
+        An OrderedDict with the load of the table, see create_load.
     """
+    if records is None:
+        records = read_genbank_records(accession_genecode)
     # First map proteincode to its name
     protein_names = {}
     with open('outputs/proteincodes', 'r') as file:
@@ -216,26 +463,35 @@ def insert_protein(cursor, accession_genecode, genecode_proteincode):
     gene_accession = {accession_genecode[k]: k for k in accession_genecode}
     # Generate the table data
     table_data = []
-    for genecode in genecode_proteincode:
+    for genecode in gene_accession:
         proteincode = genecode_proteincode[genecode]
         # If no proteincode is available, don't add it to the database
         if proteincode == '-':
             continue
-        row = dict(eiwit_id=proteincode, gen_id=genecode,
-                   eiwit_naam=protein_names[proteincode])
-        # Retrieve the sequence
-        path = 'protein_genbank_files/{}.gb'.format(gene_accession[genecode])
-        with open(path, 'rb') as genbank:
-            sequence = get_line(genbank, '/translation="')
-            while sequence[-1] != '"':
-                sequence += genbank.readline().decode().strip()
-            row['eiwit_sequentie'] = sequence[:-1]
-        table_data.append(row)
-    insert_data(cursor, 'Eiwit_07', table_data)
-
-
-def insert_protein_reactions(cursor, proteincode_kegg):
-    """ Retrieves and inserts data to the 'Reactie_07' and
+        record = records[gene_accession[genecode]]
+        # The translation of the CDS is the protein sequence, a protein
+        # record without one contains the protein in the ORIGIN
+        sequence = record['translation']
+        if sequence is None:
+            sequence = record['sequence'].upper()
+        table_data.append(dict(eiwit_id=proteincode, gen_id=genecode,
+                               eiwit_naam=protein_names[proteincode],
+                               eiwit_sequentie=sequence))
+    return OrderedDict([('Eiwit_07', create_load(
+        'Eiwit_07', table_data, ('eiwit_id',), incremental))])
+
+
+def insert_protein(cursor, accession_genecode, genecode_proteincode,
+                   records=None, incremental=False):
+    """ Inserts data to the Eiwit_07 table, see prepare_protein."""
+    run_loads(cursor, prepare_protein(accession_genecode,
+                                      genecode_proteincode, records,
+                                      incremental))
+
+
+def prepare_protein_reactions(cursor, proteincode_kegg, workers=1,
+                              incremental=False, checkpoint=None):
+    """ Retrieves and prepares data for the 'Reactie_07' and
     'EiwitReactie_07' tables. The latter table is the junction table.
 
     First this will retrieve the information from the file
@@ -248,28 +504,52 @@ def insert_protein_reactions(cursor, proteincode_kegg):
         cursor - Cursor object. The cursor object to execute queries.
         proteincode_kegg - dictionary. This is the dictionary with
         proteincodes as keys and KEGG proteincodes as values.
+        workers - int. The amount of concurrent downloads.
+        incremental - boolean. Whether the stored reactions are reused
+        and the old links of the proteins are replaced.
+        checkpoint - Checkpoint object. When given, the retrieved data
+        is stored in the 'reactions' stage.
     Returns:
-        Nothing
+        An OrderedDict with the loads of the tables, see create_load.
     """
-    proteincode_reaction, reactions = get_reaction_data(proteincode_kegg)
-    protein_reaction = [{"eiwit_id": p, "reactie_id": r}
-                        for p in proteincode_reaction for r in
-                        proteincode_reaction[p]]
+    known_reactions = get_existing_keys(cursor, 'Reactie_07', 'reactie_id') \
+        if incremental else ()
+    proteincode_reaction, reactions = run_stage(
+        checkpoint, 'reactions', get_reaction_data, proteincode_kegg, workers,
+        known_reactions)
+    protein_reaction = get_unique_rows(
+        {"eiwit_id": p, "reactie_id": r}
+        for p in proteincode_reaction for r in proteincode_reaction[p])
     reaction = [{'reactie_id': id, 'reactie': reactions[id]['reaction'],
                  'reactie_ec': reactions[id]['ec'][0]}
                 for id in reactions]
-    insert_data(cursor, 'Reactie_07', reaction)
-    insert_data(cursor, 'EiwitReactie_07', protein_reaction)
+    return OrderedDict([
+        ('Reactie_07', create_load('Reactie_07', reaction, ('reactie_id',),
+                                   incremental, update=False)),
+        ('EiwitReactie_07', create_load(
+            'EiwitReactie_07', protein_reaction, incremental=incremental,
+            replace=('eiwit_id', list(proteincode_kegg))))
+    ])
 
 
-def create_formatted_pathway_data(pathway, id, path_data, stored_authors,
+def insert_protein_reactions(cursor, proteincode_kegg, workers=1,
+                             incremental=False, checkpoint=None):
+    """ Retrieves and inserts data to the 'Reactie_07' and
+    'EiwitReactie_07' tables, see prepare_protein_reactions.
+    """
+    run_loads(cursor, prepare_protein_reactions(
+        cursor, proteincode_kegg, workers, incremental, checkpoint))
+
+
+def create_formatted_pathway_data(pathway, id, path_data, authors,
                                   author_data, ref_author_links,
                                   ref_data):
     """ Creates a row for the pathway, reference and author. This
     function should only be called when a new pathway is encountered,
-    since this function does not check for duplicate pathways. All
-    formatted data is appended to lists or dictionaries passed to
-    this function.
+    since this function does not check for duplicate pathways.
+    References which are already in ref_author_links are skipped, so
+    every reference gets a single row. All formatted data is appended
+    to lists or dictionaries passed to this function.
 
     Parameters:
         pathway - dictionary. The pathway dictionary which contains the
@@ -278,13 +558,13 @@ def create_formatted_pathway_data(pathway, id, path_data, stored_authors,
         path_data - list. This list is the actual data of the pathway
         which is eventually used with insert_data and thus contains
         rows.
-        stored_authors - list. A list of authors which already are in a
-        row.
-        author_data - list. This list is the actual data of the authors
-        which is eventually used with insert_data and thus contains
-        rows.
+        authors - EntityRegistry. The registry of the authors, seeded
+        with the authors in the database.
+        author_data - list. This list is the actual data of the new
+        authors which is eventually used with insert_data and thus
+        contains rows.
         ref_author_links - dictionary. The dictionary which contains
-        the information which references links to an author.
+        the ids of the authors of every reference.
         ref_data - list. This list is the actual data of the references
         which is eventually used with insert_data and thus contains
         rows.
@@ -294,39 +574,41 @@ def create_formatted_pathway_data(pathway, id, path_data, stored_authors,
     path_data.append({'class': pathway['class'],
                       'pathway_naam': pathway['name'], 'pathway_id': id})
     for pub in pathway['publications']:
+        # A reference can be shared by pathways, but it has a single
+        # pathway_id, so it is only stored with the first pathway
+        if pub['id'] in ref_author_links:
+            continue
         ref_data.append({'referentie_id': pub['id'], 'pathway_id': id,
                          'titel': pub['title'], 'journal': pub['journal']})
         ref_author_links[pub['id']] = []
         for author in pub['authors']:
-            if author not in stored_authors:
-                stored_authors.append(author)
+            if author not in authors:
                 author_data.append({'auteur_naam': author})
-            ref_author_links[pub['id']].append(stored_authors.index(author))
+            ref_author_links[pub['id']].append(authors.intern(author))
 
 
-def insert_reference_author_junction(cursor, ref_author_links):
-    """ This function inserts the data of the junction table
-    'ReferentieAuteur_07'. The SERIAL primary key is starting from 1
-    when the table is newly created (which this script does) and thus
-    is reliable to use this to generate the foreign keys to an author.
+def get_reference_author_rows(ref_author_links):
+    """ This function creates the rows of the junction table
+    'ReferentieAuteur_07'.
 
     Parameters:
-        cursor - Cursor object. The cursor to execute queries with.
         ref_author_links - dictionary. The dictionary which contains
-        the information which reference links to which author.
+        the ids of the authors of every reference.
+    Returns:
+        A list of dictionaries without duplicates.
     """
     reference_author_data = []
     for ref in ref_author_links:
         for author_id in ref_author_links[ref]:
             # Create a row for the junction table
-            reference_author_data.append({'auteur_id': author_id + 1,
-                                          'referentie_id': ref})
-    insert_data(cursor, 'ReferentieAuteur_07', reference_author_data)
+            reference_author_data.append(
+                {'auteur_id': author_id, 'referentie_id': ref})
+    return get_unique_rows(reference_author_data)
 
 
-def insert_domain(cursor, pfam, pfam_links):
-    """ Inserts all the data for the domain table in the database. Also
-    inserts the associated junction table with it.
+def prepare_domain(cursor, pfam, pfam_links, incremental=False):
+    """ Prepares all the data for the domain table and the associated
+    junction table. Domains which are already stored are reused.
 
     Parameters:
         cursor - Cursor object. The cursor to execute queries with.
@@ -334,99 +616,298 @@ def insert_domain(cursor, pfam, pfam_links):
         which is retrieved by get_pathway_pfam_data.
         pfam_links - dictionary. The dictionary containing the raw
         junction table data.
+        incremental - boolean. Whether the old links of the proteins
+        are replaced.
     Returns:
-        Nothing
+        An OrderedDict with the loads of the tables, see create_load.
     """
-    # Generate junction data
-    junction_data = [{'eiwit_id': p, 'domein_id': d}
-                     for p in pfam_links for d in pfam_links[p]]
+    # The domains which are already stored keep their ids
+    domains = EntityRegistry.from_database(cursor, 'Domein_07', 'domein_id',
+                                           'domein_naam')
     # Generate the actual table data
     domain_data = []
     for d in pfam:
+        # Known domains are not downloaded again
+        if pfam[d] is None:
+            continue
         instance = {'domein_naam': d,
                     'gem_domein_lengte': pfam[d]['av_length'],
                     'gem_alignment_coverage': pfam[d]['percentage_identity'],
                     'gem_sequentie_coverage': pfam[d]['av_coverage']}
         domain_data.append(instance)
-    # Insert the actual data to tables
-    insert_data(cursor, 'Domein_07', domain_data)
-    insert_data(cursor, 'EiwitDomein_07', junction_data)
+    # The links refer to the order of pfam
+    domain_ids = [domains.intern(d) for d in pfam]
+    # Generate junction data
+    junction_data = get_unique_rows(
+        {'eiwit_id': p, 'domein_id': domain_ids[d - 1]}
+        for p in pfam_links for d in pfam_links[p])
+    return OrderedDict([
+        ('Domein_07', create_load(
+            'Domein_07', get_new_entity_rows(domains, domain_data,
+                                             'domein_id', 'domein_naam'),
+            serial='domein_id')),
+        ('EiwitDomein_07', create_load(
+            'EiwitDomein_07', junction_data, incremental=incremental,
+            replace=('eiwit_id', list(pfam_links))))
+    ])
+
+
+def insert_domain(cursor, pfam, pfam_links, incremental=False):
+    """ Inserts all the data for the domain table in the database, see
+    prepare_domain.
+    """
+    run_loads(cursor, prepare_domain(cursor, pfam, pfam_links, incremental))
 
 
-def insert_pathway_domains(cursor, proteincode_kegg):
+def prepare_pathway_domains(cursor, proteincode_kegg, workers=1,
+                            incremental=False, checkpoint=None):
     """ This is the main function of retrieving data for the pathway
-    branch of the database and inserts it into the database. The script
-    pathway_pfam.py is responsible for retrieving all raw data for the
-    pathway and pfam (domains).
+    branch of the database and prepares it for the database. The
+    script pathway_pfam.py is responsible for retrieving all raw data
+    for the pathway and pfam (domains).
 
     Parameters:
         cursor - Cursor object. The object to execute queries with.
         proteincode_kegg - dictionary. This is the dictionary which has
         proteincodes as keys and the kegg asn's as values.
+        workers - int. The amount of concurrent downloads.
+        incremental - boolean. Whether stored pathways, references and
+        domains are reused and the old links of the proteins and
+        references are replaced.
+        checkpoint - Checkpoint object. When given, the retrieved data
+        is stored in the 'pathway_pfam' stage.
     Returns:
-        Nothing
+        An OrderedDict with the loads of the tables, see create_load.
     """
+    known_pathways, known_domains = (), ()
+    if incremental:
+        known_pathways = get_existing_keys(cursor, 'Pathway_07',
+                                           'pathway_id')
+        known_domains = get_existing_keys(cursor, 'Domein_07', 'domein_naam')
     # Retrieve the actual data
-    paths, path_links, pfams, pfam_links = get_pathway_pfam_data(
-        proteincode_kegg)
-    # Insert domain info
-    insert_domain(cursor, pfams, pfam_links)
+    paths, path_links, pfams, pfam_links = run_stage(
+        checkpoint, 'pathway_pfam', get_pathway_pfam_data, proteincode_kegg,
+        workers, known_pathways, known_domains)
+    # Prepare domain info
+    loads = prepare_domain(cursor, pfams, pfam_links, incremental)
     # Convert pathway links to the actual junction table
-    protein_links = [{'eiwit_id': k, 'pathway_id': asn}
-                     for k in path_links for asn in path_links[k]]
+    protein_links = get_unique_rows({'eiwit_id': k, 'pathway_id': asn}
+                                    for k in path_links
+                                    for asn in path_links[k])
     # Convert the pathway data to the table format
     # Also do this for the references and authors
     # (since this is cascaded)
-    pathway_data, stored_authors, author_data = [], [], []
+    authors = EntityRegistry.from_database(cursor, 'Auteur_07', 'auteur_id',
+                                           'auteur_naam')
+    pathway_data, author_data = [], []
     reference_author_links, reference_data = {}, []
     for pathway_code in paths:
+        # Known pathways are not downloaded again
+        if paths[pathway_code] is None:
+            continue
         create_formatted_pathway_data(paths[pathway_code], pathway_code,
-                                      pathway_data, stored_authors,
-                                      author_data,
+                                      pathway_data, authors, author_data,
                                       reference_author_links, reference_data)
-    # Insert all the data
-    insert_data(cursor, 'Pathway_07', pathway_data)
+    loads['Pathway_07'] = create_load('Pathway_07', pathway_data,
+                                      ('pathway_id',), incremental,
+                                      update=False)
     # Use correct format for the protein - pathway junction table
-    insert_data(cursor, 'EiwitPathway_07', protein_links)
-    insert_data(cursor, 'Referentie_07', reference_data)
-    insert_data(cursor, 'Auteur_07', author_data)
-    insert_reference_author_junction(cursor, reference_author_links)
+    loads['EiwitPathway_07'] = create_load(
+        'EiwitPathway_07', protein_links, incremental=incremental,
+        replace=('eiwit_id', list(path_links)))
+    loads['Referentie_07'] = create_load('Referentie_07', reference_data,
+                                         ('referentie_id',), incremental,
+                                         update=False)
+    loads['Auteur_07'] = create_load(
+        'Auteur_07', get_new_entity_rows(authors, author_data, 'auteur_id',
+                                         'auteur_naam'),
+        serial='auteur_id')
+    # The links of references which are already stored are replaced
+    loads['ReferentieAuteur_07'] = create_load(
+        'ReferentieAuteur_07', get_reference_author_rows(
+            reference_author_links), incremental=incremental,
+        replace=('referentie_id', list(reference_author_links)))
+    return loads
+
+
+def insert_pathway_domains(cursor, proteincode_kegg, workers=1,
+                           incremental=False, checkpoint=None):
+    """ Retrieves the data for the pathway branch of the database and
+    inserts it, see prepare_pathway_domains.
+    """
+    run_loads(cursor, prepare_pathway_domains(
+        cursor, proteincode_kegg, workers, incremental, checkpoint))
+
+
+def tables_exist(cursor):
+    """ Checks whether the tables of create_table.sql have been created.
+    """
+    cursor.execute("SELECT to_regclass('gen_07');")
+    return cursor.fetchone()[0] is not None
 
 
-def main():
+def execute_file(cursor, path):
+    """ Executes the SQL statements of a file.
+
+    Parameters:
+        cursor - Cursor object. The cursor to execute queries with.
+        path - string. The path of the SQL file.
+    """
+    with open(path, 'rb') as f:
+        cursor.execute(f.read().decode())
+
+
+def add_constraints():
+    """ Adds the primary keys, unique constraints, foreign keys and
+    indexes of CONSTRAINTS_FILE to the loaded tables and updates the
+    statistics of the planner. Building these once after the bulk load
+    is much cheaper than checking them for every inserted row.
+    """
+    connection = psycopg2.connect(**DATABASE)
+    try:
+        execute_file(connection.cursor(), CONSTRAINTS_FILE)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def main(incremental=False, restart=False, metrics=True,
+         pack_sequences=False):
     """ This is the main function for the complete script. It first
     will blast all sequences against the genome of Alligator sinensis
-    and then extract all data out of this BLAST. Then it will download
-    all genbank protein files of the given genes, and extract data from
-    these files.
+    and then extract all data out of this BLAST. This is done in the
+    'deelopdracht B.sh' bash script. Then it will download all genbank
+    protein files of the given genes in batches (see download.py), and
+    extract data from these files.
 
-    This all is done in the 'deelopdracht B.sh' bash script. This
-    algorithm then will generate the required dictionaries which are
+    This algorithm then will generate the required dictionaries which are
     necessary to retrieve all data. Then a connection to the database
-    is made, and will execute all CREATE queries. Then in the defined
-    insert functions all data is inserted to the database.
+    is made, and will execute all CREATE queries of SCHEMA_FILE, which
+    creates the bare tables. Then in the defined insert functions all
+    data is inserted to the database. Afterwards the keys and indexes
+    of CONSTRAINTS_FILE are added.
+
+    In incremental mode the tables are not recreated. Only the
+    accessions which are new or changed compared to the database are
+    downloaded and upserted, stored pathways, references, authors,
+    domains and reactions are reused.
+
+    Every stage stores its output in the CHECKPOINT_DIRECTORY. The
+    tables are loaded in parallel (see parallel_load) and every table
+    is committed on its own. When the script is interrupted, the
+    next run skips the finished stages and continues the downloads
+    from the last finished protein. The checkpoints are removed when
+    the complete script has finished.
+
+    The timings of the stages, the requests per host and the loaded
+    rows per table are written to METRICS_REPORT, also when the script
+    fails.
 
     Finally the connection is committed, meaning that it will be saved
     by the database and connection is closed to clean up open resources
     of the database.
+
+    Parameters:
+        incremental - boolean. Whether to update the existing database
+        instead of rebuilding it.
+        restart - boolean. Whether to discard the checkpoints of an
+        interrupted run and start from scratch.
+        metrics - boolean. Whether to collect and report the metrics.
+        pack_sequences - boolean. Whether nucleotide gene sequences are
+        stored packed instead of as text, see get_sequence_columns.
     """
-    system('bash deelopdracht\\ B.sh')
+    if metrics:
+        recorder = enable_metrics()
+        try:
+            run_pipeline(incremental, restart, pack_sequences)
+        finally:
+            recorder.write_report(METRICS_REPORT)
+    else:
+        run_pipeline(incremental, restart, pack_sequences)
+
+
+def run_pipeline(incremental=False, restart=False, pack_sequences=False):
+    """ Runs all stages of the script, see main."""
+    checkpoint = Checkpoint(CHECKPOINT_DIRECTORY)
+    if restart:
+        checkpoint.clear()
+    if not checkpoint.is_done('prepare'):
+        with get_metrics().stage('prepare'):
+            status = system('bash deelopdracht\\ B.sh')
+        if status != 0:
+            raise RuntimeError('deelopdracht B.sh failed with exit status '
+                               '{}'.format(status))
+        checkpoint.save('prepare')
+    configure_cache(CACHE_DIRECTORY)
+    run_stage(checkpoint, 'download', download_genbank_files,
+              read_accessions())
     genecode, proteincode, genecode2proteincode = get_accession_dictionaries()
-    proteincode2kegg = get_gi_kegg_dictionary([code for code in
-                                               proteincode.values()])
-    connection = psycopg2.connect(dbname="postgres", user="Bpgepr161707",
-                                  password="****")
+    connection = psycopg2.connect(**DATABASE)
 
     cursor = connection.cursor()
-    with open('create_table.sql', 'rb') as f:
-        cursor.execute(f.read().decode())
-        connection.commit()
-    insert_gene_exon(cursor, genecode)
-    insert_protein(cursor, genecode, genecode2proteincode)
-    insert_protein_reactions(cursor, proteincode2kegg)
-    insert_pathway_domains(cursor, proteincode2kegg)
+    if checkpoint.is_done('accessions'):
+        # The database already contains the loads of the interrupted
+        # run, so it can not be compared again
+        genecode, proteincode, incremental = checkpoint.load('accessions')
+    else:
+        incremental = incremental and tables_exist(cursor)
+        if incremental:
+            changed = get_changed_accessions(cursor, genecode, proteincode)
+            genecode = {acc: genecode[acc] for acc in changed}
+            proteincode = {acc: proteincode[acc] for acc in changed}
+            # The changed genes are loaded again instead of updated,
+            # since their genecode or proteincode differs
+            delete_genes(cursor, changed, proteincode.values())
+            connection.commit()
+        else:
+            execute_file(cursor, SCHEMA_FILE)
+            connection.commit()
+        checkpoint.save('accessions', [genecode, proteincode, incremental])
+    proteincode2kegg = run_stage(checkpoint, 'gi_conversion',
+                                 get_gi_kegg_dictionary,
+                                 [code for code in proteincode.values()])
+    records = read_genbank_records(genecode)
+    loads = prepare_gene_exon(genecode, records, incremental,
+                              pack_sequences)
+    loads.update(prepare_protein(genecode, genecode2proteincode, records,
+                                 incremental))
+    loads.update(prepare_protein_reactions(cursor, proteincode2kegg,
+                                           FETCH_WORKERS, incremental,
+                                           checkpoint))
+    loads.update(prepare_pathway_domains(cursor, proteincode2kegg,
+                                         FETCH_WORKERS, incremental,
+                                         checkpoint))
+    # End the transaction of the queries above
     connection.commit()
     connection.close()
+    # Every table is loaded and committed on its own connection, as
+    # soon as the tables it references are loaded
+    loads = OrderedDict((table, loads[table]) for table in loads
+                        if not checkpoint.is_done('load_' + table))
+    # The bare tables of a full load have no foreign keys yet, so they
+    # can be loaded in any order
+    schema = [SCHEMA_FILE, CONSTRAINTS_FILE] if incremental \
+        else [SCHEMA_FILE]
+    pool = psycopg2.pool.ThreadedConnectionPool(1, LOAD_WORKERS, **DATABASE)
+    try:
+        loader = ParallelLoader(pool, read_dependencies(*schema))
+        loader.run(loads, lambda table: checkpoint.save('load_' + table))
+    finally:
+        pool.closeall()
+    if not incremental and not checkpoint.is_done('constraints'):
+        with get_metrics().stage('constraints'):
+            add_constraints()
+        checkpoint.save('constraints')
+    # Clear the cached results of the clients of queries
+    connection = psycopg2.connect(**DATABASE)
+    try:
+        notify_loaded(connection.cursor())
+        connection.commit()
+    finally:
+        connection.close()
+    checkpoint.clear()
 
 
-main()
+main(incremental='--incremental' in argv, restart='--restart' in argv,
+     metrics='--no-metrics' not in argv,
+     pack_sequences='--pack-sequences' in argv)
@@ -0,0 +1,250 @@
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+from location_parser import ComplementLocation, JoinedLocation
+
+# A single indexed range. The start is always the lowest position, also
+# for ranges on the complement strand.
+Interval = namedtuple('Interval', ('start', 'end', 'complement', 'payload'))
+
+# The order of the columns of the Exon_07 table, used for rows which
+# are not dictionaries (like rows from a cursor)
+EXON_COLUMNS = ('exon_id', 'gen_id', 'start_positie', 'eind_positie',
+                'complement')
+
+
+class IntervalIndex(object):
+    """ A static index on ranges which answers overlap, containment and
+    nearest range queries in logarithmic time. The ranges are sorted on
+    their start and the index is an implicit balanced tree over that
+    sorted list: every middle element of a slice stores the highest
+    end within that slice, so slices which end before a query can be
+    skipped completely.
+
+    All positions are inclusive, like the ranges in a GenBank file.
+    Ranges on the complement strand are stored with their lowest
+    position as start, so queries work the same for both strands. Every
+    query can be limited to one strand with the complement argument.
+    """
+
+    def __init__(self, intervals):
+        """ Builds the index in one go.
+
+        Parameters:
+            intervals - iterable. Interval objects or tuples with the
+            start, end, complement and payload of every range.
+        """
+        normalized = []
+        for start, end, complement, payload in intervals:
+            if start > end:
+                start, end = end, start
+            normalized.append(Interval(start, end, bool(complement),
+                                       payload))
+        normalized.sort(key=lambda interval: (interval.start, interval.end))
+        self._intervals = normalized
+        self._starts = [interval.start for interval in normalized]
+        self._ends = [interval.end for interval in normalized]
+        self._max_ends = list(self._ends)
+        self._build_max_ends(0, len(normalized))
+        # The ranges sorted on their end, for nearest range queries
+        self._end_order = sorted(range(len(normalized)),
+                                 key=lambda i: self._ends[i])
+        self._sorted_ends = [self._ends[i] for i in self._end_order]
+        self._strand_indexes = {}
+
+    @classmethod
+    def from_locations(cls, locations):
+        """ Builds an index from parsed Location objects. Every range
+        of a joined location becomes a separate interval.
+
+        Parameters:
+            locations - iterable. Location objects or tuples with a
+            Location object and a payload. Without a payload, the
+            location itself is the payload.
+        Returns:
+            A new IntervalIndex.
+        """
+        intervals = []
+        for item in locations:
+            location, payload = item if isinstance(item, tuple) \
+                else (item, item)
+            complement = isinstance(location, ComplementLocation)
+            if isinstance(location, JoinedLocation):
+                ranges = location.get_ranges()
+            else:
+                ranges = [location.get_range()]
+            for start, end in ranges:
+                intervals.append((start, end, complement, payload))
+        return cls(intervals)
+
+    @classmethod
+    def from_exon_rows(cls, rows):
+        """ Builds an index from rows of the Exon_07 table. Note that
+        the positions of exons are relative to their gene, so the rows
+        should belong to a single gene. Use build_exon_indexes for rows
+        of multiple genes.
+
+        Parameters:
+            rows - iterable. Dictionaries with at least the columns
+            start_positie, eind_positie and complement (as generated by
+            get_exon_rows), or sequences in the order of EXON_COLUMNS.
+            The row itself is the payload.
+        Returns:
+            A new IntervalIndex.
+        """
+        return cls((row['start_positie'], row['eind_positie'],
+                    row['complement'], row) for row in map(_as_exon_dict,
+                                                           rows))
+
+    def _build_max_ends(self, lo, hi):
+        """ Stores the highest end of every slice on its middle element
+        and returns it.
+        """
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        max_end = self._ends[mid]
+        for child in (self._build_max_ends(lo, mid),
+                      self._build_max_ends(mid + 1, hi)):
+            if child is not None and child > max_end:
+                max_end = child
+        self._max_ends[mid] = max_end
+        return max_end
+
+    def _strand(self, complement):
+        """ Retrieves the index which only contains one strand. These
+        are built on first use.
+        """
+        if complement is None:
+            return self
+        complement = bool(complement)
+        if complement not in self._strand_indexes:
+            self._strand_indexes[complement] = IntervalIndex(
+                interval for interval in self._intervals
+                if interval.complement == complement)
+        return self._strand_indexes[complement]
+
+    def overlapping(self, start, end, complement=None):
+        """ Finds all ranges which share at least one position with the
+        given region.
+
+        Parameters:
+            start - int. The first position of the region.
+            end - int. The last position of the region.
+            complement - boolean. When given, only ranges on that strand
+            are returned.
+        Returns:
+            A list of Interval objects sorted on their start.
+        """
+        index = self._strand(complement)
+        if start > end:
+            start, end = end, start
+        found = []
+        slices = [(0, len(index._intervals))]
+        while slices:
+            lo, hi = slices.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            # Nothing in this slice reaches the region
+            if index._max_ends[mid] < start:
+                continue
+            slices.append((lo, mid))
+            # Everything right of mid starts after the start of mid
+            if index._starts[mid] <= end:
+                if index._ends[mid] >= start:
+                    found.append(mid)
+                slices.append((mid + 1, hi))
+        return [index._intervals[i] for i in sorted(found)]
+
+    def containing(self, position, complement=None):
+        """ Finds all ranges which contain the position.
+
+        Parameters:
+            position - int. The position to look for.
+            complement - boolean. When given, only ranges on that strand
+            are returned.
+        Returns:
+            A list of Interval objects sorted on their start.
+        """
+        return self.overlapping(position, position, complement)
+
+    def within(self, start, end, complement=None):
+        """ Finds all ranges which lie completely within the region.
+
+        Parameters:
+            start - int. The first position of the region.
+            end - int. The last position of the region.
+            complement - boolean. When given, only ranges on that strand
+            are returned.
+        Returns:
+            A list of Interval objects sorted on their start.
+        """
+        index = self._strand(complement)
+        if start > end:
+            start, end = end, start
+        first = bisect_left(index._starts, start)
+        last = bisect_right(index._starts, end)
+        return [interval for interval in index._intervals[first:last]
+                if interval.end <= end]
+
+    def nearest(self, position, complement=None):
+        """ Finds the range which is the closest to the position. A
+        range which contains the position is always the closest. On a
+        tie, the range to the left wins.
+
+        Parameters:
+            position - int. The position to look from.
+            complement - boolean. When given, only ranges on that strand
+            are considered.
+        Returns:
+            A tuple with the Interval and the distance to it, or None
+            when the index is empty.
+        """
+        index = self._strand(complement)
+        containing = index.containing(position)
+        if containing:
+            return containing[0], 0
+        best = None
+        # The range with the highest end before the position
+        left = bisect_left(index._sorted_ends, position) - 1
+        if left >= 0:
+            interval = index._intervals[index._end_order[left]]
+            best = interval, position - interval.end
+        # The range with the lowest start after the position
+        right = bisect_right(index._starts, position)
+        if right < len(index._intervals):
+            interval = index._intervals[right]
+            if best is None or interval.start - position < best[1]:
+                best = interval, interval.start - position
+        return best
+
+    def __iter__(self):
+        return iter(self._intervals)
+
+    def __len__(self):
+        return len(self._intervals)
+
+
+def _as_exon_dict(row):
+    """ Converts a row of the Exon_07 table to a dictionary."""
+    if isinstance(row, dict):
+        return row
+    return dict(zip(EXON_COLUMNS, row))
+
+
+def build_exon_indexes(rows):
+    """ Builds an IntervalIndex for the exons of every gene.
+
+    Parameters:
+        rows - iterable. Rows of the Exon_07 table, see
+        IntervalIndex.from_exon_rows.
+    Returns:
+        A dictionary with the gen_id as keys and an IntervalIndex as
+        values.
+    """
+    genes = {}
+    for row in map(_as_exon_dict, rows):
+        genes.setdefault(row['gen_id'], []).append(row)
+    return {gen_id: IntervalIndex.from_exon_rows(gene_rows)
+            for gen_id, gene_rows in genes.items()}
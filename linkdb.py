@@ -0,0 +1,60 @@
+from collections import OrderedDict
+from re import compile
+
+# The databases of the genome.jp linkdb and the prefix which is used for
+# them in the links of a linkdb page
+DATABASE_PREFIXES = {
+    'reaction': 'rn',
+    'pathway': 'path',
+    'orthology': 'ko',
+    'enzyme': 'ec',
+    'compound': 'cpd',
+    'module': 'md',
+    'rclass': 'rc',
+    'glycan': 'gl',
+    'disease': 'ds',
+    'drug': 'dr'
+}
+
+# Matches the database prefix and identifier in the href of a link,
+# like <a href="/dbget-bin/www_bget?rn:R00710">R00710</a>
+_LINK_PATTERN = compile(r'<a\s[^>]*?href="[^"]*?[?/]([A-Za-z]+):'
+                        r'([^"&+\s]+)"')
+
+
+def extract_links(html_text):
+    """ Collects all linked identifiers of a linkdb page in a single
+    pass over the text.
+
+    Parameters:
+        html_text - string. The text of the linkdb HTML page.
+    Returns:
+        An OrderedDict with the database prefixes (like 'rn' or 'path')
+        as keys and a list of identifiers as values. The identifiers
+        are in the order of the page and each identifier is only
+        listed once.
+    """
+    links = OrderedDict()
+    seen = set()
+    for match in _LINK_PATTERN.finditer(html_text):
+        prefix, identifier = match.group(1).lower(), match.group(2)
+        if (prefix, identifier) not in seen:
+            seen.add((prefix, identifier))
+            links.setdefault(prefix, []).append(identifier)
+    return links
+
+
+def extract_link_ids(html_text, database):
+    """ Collects the linked identifiers of one database of a linkdb
+    page.
+
+    Parameters:
+        html_text - string. The text of the linkdb HTML page.
+        database - string. The name of the database (like 'reaction')
+        or its prefix (like 'rn').
+    Returns:
+        A list with the identifiers in the order of the page, without
+        duplicates.
+    """
+    prefix = DATABASE_PREFIXES.get(database, database)
+    return extract_links(html_text).get(prefix, [])
@@ -0,0 +1,148 @@
+# Vectorized versions of the position checks of location_parser, for
+# millions of positions at once. This module requires NumPy. All
+# positions are inclusive, like the ranges in a GenBank file.
+from collections import namedtuple
+
+import numpy as np
+
+from location_parser import ComplementLocation, JoinedLocation
+
+# The ranges of a collection of locations, flattened to arrays which are
+# sorted on their start. Every range knows the index of its location,
+# the strand and the offset of the range within the spliced location.
+SegmentArrays = namedtuple('SegmentArrays', ('starts', 'ends', 'location',
+                                             'complement', 'base'))
+
+
+def flatten_locations(locations):
+    """ Converts a collection of Location objects to SegmentArrays. The
+    result can be passed to the other functions instead of the
+    locations, so it only has to be done once for many queries.
+
+    The base of a range is the amount of positions of the same location
+    which are read before it. For locations on the complement strand,
+    the ranges are read from the last to the first and from the end to
+    the start.
+
+    Parameters:
+        locations - sequence. Location objects, joined and complement
+        locations included.
+    Returns:
+        A SegmentArrays object.
+    """
+    starts, ends, indexes, complements, bases = [], [], [], [], []
+    for index, location in enumerate(locations):
+        if isinstance(location, JoinedLocation):
+            location_starts = np.asarray(location.starts, dtype=np.int64)
+            location_ends = np.asarray(location.ends, dtype=np.int64)
+        else:
+            first, second = location.get_range()
+            location_starts = np.array([first], dtype=np.int64)
+            location_ends = np.array([second], dtype=np.int64)
+        lengths = location_ends - location_starts + 1
+        complement = isinstance(location, ComplementLocation)
+        if complement:
+            # Everything after this range is read before it
+            base = np.cumsum(lengths[::-1])[::-1] - lengths
+        else:
+            base = np.cumsum(lengths) - lengths
+        starts.append(location_starts)
+        ends.append(location_ends)
+        bases.append(base)
+        indexes.append(np.full(len(lengths), index, dtype=np.int64))
+        complements.append(np.full(len(lengths), complement, dtype=bool))
+    if not starts:
+        empty = np.empty(0, dtype=np.int64)
+        return SegmentArrays(empty, empty, empty, np.empty(0, dtype=bool),
+                             empty)
+    segments = SegmentArrays(*[np.concatenate(values) for values in
+                               (starts, ends, indexes, complements, bases)])
+    order = np.argsort(segments.starts, kind='stable')
+    return SegmentArrays(*[values[order] for values in segments])
+
+
+def _as_segments(locations):
+    if isinstance(locations, SegmentArrays):
+        return locations
+    return flatten_locations(locations)
+
+
+def locate_positions(positions, locations):
+    """ Finds every location which contains each position. The
+    positions are sorted once and every range looks up its first and
+    last position with a binary search, so no method is called per
+    position.
+
+    Parameters:
+        positions - array like. Integer positions.
+        locations - sequence of Location objects or SegmentArrays.
+    Returns:
+        Three arrays of equal length with a row per hit, sorted on the
+        position and then the location:
+            1. The index of the position in positions.
+            2. The index of the location in locations.
+            3. The 0-based offset of the position within the spliced
+               location, in the reading direction of its strand.
+    """
+    segments = _as_segments(locations)
+    positions = np.asarray(positions, dtype=np.int64)
+    order = np.argsort(positions, kind='stable')
+    sorted_positions = positions[order]
+    # The slice of sorted positions which falls in every range
+    first = np.searchsorted(sorted_positions, segments.starts, side='left')
+    last = np.searchsorted(sorted_positions, segments.ends, side='right')
+    counts = np.maximum(last - first, 0)
+    segment = np.repeat(np.arange(len(counts)), counts)
+    # The place of every hit within the slice of its range
+    within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                                  counts)
+    position_index = order[first[segment] + within]
+    hits = positions[position_index]
+    offset = np.where(segments.complement[segment],
+                      segments.ends[segment] - hits,
+                      hits - segments.starts[segment]) + segments.base[segment]
+    location_index = segments.location[segment]
+    result_order = np.lexsort((location_index, position_index))
+    return (position_index[result_order], location_index[result_order],
+            offset[result_order])
+
+
+def containment_mask(positions, locations):
+    """ Checks for every position whether it is in any of the
+    locations.
+
+    Parameters:
+        positions - array like. Integer positions.
+        locations - sequence of Location objects or SegmentArrays.
+    Returns:
+        A boolean array with the same length as positions.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    mask = np.zeros(len(positions), dtype=bool)
+    mask[locate_positions(positions, locations)[0]] = True
+    return mask
+
+
+def first_containing(positions, locations):
+    """ Finds for every position the first location (lowest index)
+    which contains it, and the offset within that location.
+
+    Parameters:
+        positions - array like. Integer positions.
+        locations - sequence of Location objects or SegmentArrays.
+    Returns:
+        Two arrays with the same length as positions: the index of the
+        location and the offset. Both are -1 for positions which are
+        not in any location.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    position_index, location_index, offset = locate_positions(positions,
+                                                              locations)
+    found_location = np.full(len(positions), -1, dtype=np.int64)
+    found_offset = np.full(len(positions), -1, dtype=np.int64)
+    # The hits are sorted, so the first hit of a position is the lowest
+    # location
+    unique, first = np.unique(position_index, return_index=True)
+    found_location[unique] = location_index[first]
+    found_offset[unique] = offset[first]
+    return found_location, found_offset
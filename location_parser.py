@@ -1,3 +1,8 @@
+from array import array
+from collections import OrderedDict
+from threading import Lock
+
+
 class LocationType:
     """ All the location types which can occur in a Genbank file. This
     is used in every Location object on the 'static' variable type to
@@ -27,8 +32,15 @@ class Location(object):
     may be manipulated.
 
     Please refer to method documentations to view what this can do.
+
+    Every location class defines __slots__ to keep the objects small,
+    since millions of them can be created.
     """
 
+    # _frozen tells whether the location can still be changed, see
+    # _freeze
+    __slots__ = ('first', 'second', '_frozen')
+
     # Type of the location
     type = None
 
@@ -43,6 +55,18 @@ class Location(object):
         self.first = -1
         self.second = -1
 
+    def __setattr__(self, name, value):
+        if getattr(self, '_frozen', False):
+            raise AttributeError('Cached Location objects are immutable!')
+        super(Location, self).__setattr__(name, value)
+
+    def _freeze(self):
+        """ Makes this location immutable. This is done for every
+        location which is stored in the cache of parse_location, since
+        the same object is returned for every equal location string.
+        """
+        object.__setattr__(self, '_frozen', True)
+
     def get_range(self):
         """ Retrieves the range of the current location.
 
@@ -121,6 +145,7 @@ class SingleBaseLocation(Location):
         Where n is a number in a sequence
     """
 
+    __slots__ = ()
     type = LocationType.single_base
 
     def __init__(self, location_string):
@@ -141,6 +166,7 @@ class DelimitedLocation(Location):
     class.
     """
 
+    __slots__ = ()
     # The delimiter to use
     delimiter = None
 
@@ -208,11 +234,10 @@ class AdjoiningLocation(DelimitedLocation):
             n^1 -> circulair molecule
     """
 
+    __slots__ = ('subtype',)
     type = LocationType.adjoining
     delimiter = '^'
 
-    subtype = ''
-
     def _parse_left(self, string):
         self.first = _convert(int, string)
 
@@ -244,13 +269,32 @@ class RangeLocation(DelimitedLocation):
     This represents a range of residues including both x and y.
     """
 
+    __slots__ = ('can_be_lesser', 'can_be_greater')
     type = LocationType.range
     delimiter = '..'
 
-    def __init__(self, string):
-        super(RangeLocation, self).__init__(string)
-        self.can_be_lesser = False
-        self.can_be_greater = False
+    @classmethod
+    def from_bounds(cls, first, second, can_be_lesser=False,
+                    can_be_greater=False):
+        """ Creates a RangeLocation without parsing a string.
+
+        Parameters:
+            first - int. The first position of the range.
+            second - int. The last position of the range.
+            can_be_lesser - boolean. Whether the range is open on the
+            left (<x).
+            can_be_greater - boolean. Whether the range is open on the
+            right (>y).
+        Returns:
+            A new RangeLocation.
+        """
+        location = cls.__new__(cls)
+        Location.__init__(location, None)
+        location.first = first
+        location.second = second
+        location.can_be_lesser = bool(can_be_lesser)
+        location.can_be_greater = bool(can_be_greater)
+        return location
 
     def _parse_left(self, string):
         self.can_be_lesser = string[0] == '<'
@@ -276,12 +320,10 @@ class RemoteLocation(DelimitedLocation):
             given accession sequence at that given location.
     """
 
+    __slots__ = ('accession', 'location')
     type = LocationType.remote
     delimiter = ':'
 
-    accession = ''
-    location = None
-
     def _parse_left(self, string):
         self.accession = string.strip()
         if len(string) == 0:
@@ -290,6 +332,10 @@ class RemoteLocation(DelimitedLocation):
     def _parse_right(self, string):
         self.location = parse_location(string)
 
+    def _freeze(self):
+        self.location._freeze()
+        super(RemoteLocation, self)._freeze()
+
     def get_range(self):
         return self.location.get_range()
 
@@ -314,11 +360,93 @@ class JoinedLocation(Location):
     Looks like:
         join(range, range)
          Where range represents a RangeLocation
+
+    The ranges are not stored as separate objects, but as parallel
+    integer arrays: starts, ends and the partial flags lesser (<x) and
+    greater (>y). The first and second variables contain the complete
+    span of the ranges.
     """
 
+    # _members contains the original locations when they cannot be
+    # represented by the arrays alone (like RemoteLocations)
+    __slots__ = ('starts', 'ends', 'lesser', 'greater', '_members')
+
     def __init__(self, *locations):
         super(JoinedLocation, self).__init__(None)
-        self.locations = locations
+        starts, ends = array('l'), array('l')
+        lesser, greater = array('b'), array('b')
+        members = None
+        for location in locations:
+            if isinstance(location, JoinedLocation):
+                # A nested join, like complement(join(...))
+                starts.extend(location.starts)
+                ends.extend(location.ends)
+                lesser.extend(location.lesser)
+                greater.extend(location.greater)
+                continue
+            first, second = location.get_range()
+            starts.append(first)
+            ends.append(second)
+            lesser.append(getattr(location, 'can_be_lesser', False))
+            greater.append(getattr(location, 'can_be_greater', False))
+            if not isinstance(location, (RangeLocation, SingleBaseLocation)):
+                members = locations
+        self._set_arrays(starts, ends, lesser, greater)
+        self._members = members
+
+    @classmethod
+    def from_arrays(cls, starts, ends, lesser=None, greater=None):
+        """ Creates a location of this class directly from the arrays
+        of the ranges, without parsing or creating RangeLocations.
+
+        Parameters:
+            starts - iterable. The first position of every range.
+            ends - iterable. The last position of every range.
+            lesser - iterable. Whether every range is open on the left.
+            By default no range is.
+            greater - iterable. Whether every range is open on the
+            right. By default no range is.
+        Returns:
+            A new location of this class.
+        """
+        location = cls.__new__(cls)
+        Location.__init__(location, None)
+        starts, ends = array('l', starts), array('l', ends)
+        if len(starts) != len(ends):
+            raise ValueError('Every range needs a start and an end!')
+        location._set_arrays(
+            starts, ends,
+            array('b', lesser if lesser is not None else [0] * len(starts)),
+            array('b', greater if greater is not None else [0] * len(ends)))
+        location._members = None
+        return location
+
+    def _set_arrays(self, starts, ends, lesser, greater):
+        self.starts, self.ends = starts, ends
+        self.lesser, self.greater = lesser, greater
+        if starts:
+            self.first, self.second = min(starts), max(ends)
+
+    @property
+    def locations(self):
+        """ The locations of this object as a tuple of RangeLocations.
+        These are created on request from the arrays.
+        """
+        if self._members is not None:
+            return self._members
+        return tuple(RangeLocation.from_bounds(*values) for values in
+                     zip(self.starts, self.ends, self.lesser, self.greater))
+
+    def _freeze(self):
+        # Make the arrays read only as well
+        for name in ('starts', 'ends', 'lesser', 'greater'):
+            view = memoryview(getattr(self, name))
+            if hasattr(view, 'toreadonly'):
+                object.__setattr__(self, name, view.toreadonly())
+        if self._members is not None:
+            for location in self._members:
+                location._freeze()
+        super(JoinedLocation, self)._freeze()
 
     def calculate_inversed_locations(self, genome_length):
         """ Calculates the locations that are not represented by this
@@ -332,49 +460,73 @@ class JoinedLocation(Location):
             A list of RangeLocation objects representing the inversed
             locations of this object.
         """
+        starts, ends = self.get_inversed_arrays(genome_length)
+        return [RangeLocation.from_bounds(first, second)
+                for first, second in zip(starts, ends)]
+
+    def get_inversed_arrays(self, genome_length):
+        """ Calculates the ranges which are not covered by this object,
+        see calculate_inversed_locations. The ranges must be sorted.
+
+        Parameters:
+            genome_length - int
+                The length of the sequence to compare to
+        Returns:
+            Two arrays: the starts and the ends of the inversed ranges.
+        """
         # Length must be positive
         if genome_length < 1:
             raise ValueError('Genome length must be set!')
-        last_seq_index = 1
-        locations = []
-
-        for first, last in self.get_ranges():
-            # When the last border is the same as the first of this
-            # location, there is no intron in front of here
-            if first == last_seq_index:
-                continue
-            locations.append(RangeLocation('{}..{}'.format(last_seq_index,
-                                                           first - 1)))
-            last_seq_index = last + 1
-        # Check for remaining intron to the right of the last exon
-        if genome_length > last_seq_index:
-            locations.append(RangeLocation('{}..{}'.format(last_seq_index,
-                                                           genome_length)))
-        return locations
+        # Each gap runs from the end of the previous range up to the
+        # start of the next range, the last gap up to the genome length
+        gap_starts = [1] + [end + 1 for end in self.ends]
+        gap_ends = [start - 1 for start in self.starts] + [genome_length]
+        starts, ends = array('l'), array('l')
+        for first, last in zip(gap_starts, gap_ends):
+            if first <= last:
+                starts.append(first)
+                ends.append(last)
+        return starts, ends
 
     def get_range(self):
         raise NotImplementedError
 
     def get_ranges(self):
-        """ This is a generator object which returns all the ranges
-        of the locations which this JoinedLocation object contains.
+        """ This returns all the ranges of the locations which this
+        JoinedLocation object contains.
 
         Returns:
-            A generator which yields the range of a location.
+            An iterator which yields the range of a location.
         """
-        for location in self.locations:
-            yield location.get_range()
+        return zip(self.starts, self.ends)
+
+    def __len__(self):
+        return sum(self.ends) - sum(self.starts) + len(self.starts)
+
+
+class OrderLocation(JoinedLocation):
+    """ Representation of the order operator in the location object.
+    The locations are in the given order, but it is not implied that
+    they are joined together.
+    Looks like:
+        order(location, location)
+    """
+
+    __slots__ = ()
 
 
 class ComplementLocation(JoinedLocation):
     """ This will represent the complement of a location. This class
     has been derived from JoinedLocation because a JoinedLocation can
-    be complement and a JoinedLocation imitates other locations as well
+    be complement and a JoinedLocation imitates other locations as well.
+    A complemented join is flattened into the arrays of this object.
 
     Looks like:
         complement(<location>)
     """
 
+    __slots__ = ()
+
     def __init__(self, location):
         super(ComplementLocation, self).__init__(location)
 
@@ -390,12 +542,12 @@ class ComplementLocation(JoinedLocation):
         Returns:
             A new JoinedLocation
         """
-        new_locations = []
-        for location in self.locations:
-            first = genome_length - location.second + 1
-            second = location.second - location.first + first
-            new_locations.append(RangeLocation('{}..{}'.format(first, second)))
-        return JoinedLocation(*new_locations)
+        # The end of a range becomes the start on the other strand and
+        # the partial flags switch sides
+        return JoinedLocation.from_arrays(
+            [genome_length - end + 1 for end in self.ends],
+            [genome_length - start + 1 for start in self.starts],
+            self.greater, self.lesser)
 
 
 def _convert(var_type, string):
@@ -406,19 +558,79 @@ def _convert(var_type, string):
                                                   string))
 
 
+# The cache of parse_location, which maps stripped location strings
+# to immutable Location objects in the order of their last use
+_location_cache = OrderedDict()
+_location_cache_lock = Lock()
+_location_cache_settings = dict(maxsize=4096)
+_location_cache_stats = dict(hits=0, misses=0, evictions=0)
+
+
+def configure_location_cache(maxsize):
+    """ Sets the maximum amount of locations in the cache of
+    parse_location. When the cache contains more locations than the
+    new maximum, the least recently used locations are evicted.
+
+    Parameters:
+        maxsize - int
+            The maximum amount of cached locations. 0 disables the
+            cache.
+    """
+    if maxsize < 0:
+        raise ValueError('The maximum size cannot be negative!')
+    with _location_cache_lock:
+        _location_cache_settings['maxsize'] = maxsize
+        __evict_locations()
+
+
+def clear_location_cache():
+    """ Removes all locations from the cache and resets the
+    statistics.
+    """
+    with _location_cache_lock:
+        _location_cache.clear()
+        for stat in _location_cache_stats:
+            _location_cache_stats[stat] = 0
+
+
+def location_cache_info():
+    """ Retrieves the statistics of the cache of parse_location.
+
+    Returns:
+        A dictionary with the keys hits, misses, evictions, size and
+        maxsize.
+    """
+    with _location_cache_lock:
+        info = dict(_location_cache_stats)
+        info['size'] = len(_location_cache)
+        info['maxsize'] = _location_cache_settings['maxsize']
+    return info
+
+
+def __evict_locations():
+    """ Evicts the least recently used locations until the cache fits
+    its maximum size. Must be called with the lock.
+    """
+    while len(_location_cache) > _location_cache_settings['maxsize']:
+        _location_cache.popitem(last=False)
+        _location_cache_stats['evictions'] += 1
+
+
 def parse_location(location_string):
     """ The main parser function which parses a string to a location
     object. A lot of types of locations are supported:
         complement(<location>)
         join(2..66, 78..101)
+        order(2..66, 78..101)
         78..101
         <78..101
         78..>101
         XM_12345:<location>
         65^1
-    The only one that is not supported yet, is the order function.
-    Generally, this function is not available in location strings and
-    makes it not mandatory.
+
+    Parsed locations are kept in a LRU cache, so the same string is
+    only parsed once. The returned Location objects are shared and
+    therefore immutable.
 
     Parameters:
         location_string - string
@@ -426,7 +638,28 @@ def parse_location(location_string):
     Returns:
         A corresponding Location object
     """
-    location = __parse_string_arguments(location_string.strip())
+    location_string = location_string.strip()
+    with _location_cache_lock:
+        location = _location_cache.get(location_string)
+        if location is not None:
+            _location_cache.pop(location_string)
+            _location_cache[location_string] = location
+            _location_cache_stats['hits'] += 1
+            return location
+        _location_cache_stats['misses'] += 1
+    location = __parse(location_string)
+    location._freeze()
+    with _location_cache_lock:
+        if _location_cache_settings['maxsize'] > 0:
+            _location_cache[location_string] = location
+            __evict_locations()
+    return location
+
+
+def __parse(location_string):
+    """ Parses the stripped location string without using the cache.
+    """
+    location = __parse_string_arguments(location_string)
     if len(location) > 1:
         raise ValueError('Cannot parse {} to a Location!'
                          .format(location_string))
@@ -529,5 +762,6 @@ def __create_func_mapping(name, func, one_arg=False, sub_func=False,
 function_mapping = [
     __create_func_mapping('complement', ComplementLocation, True, False,
                           True),
-    __create_func_mapping('join', JoinedLocation, False, True, False)
+    __create_func_mapping('join', JoinedLocation, False, True, False),
+    __create_func_mapping('order', OrderLocation, False, True, False)
 ]
@@ -0,0 +1,184 @@
+from contextlib import contextmanager
+from json import dumps
+from math import ceil
+from threading import Lock
+from time import time
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+# The latency percentiles which are reported per host
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values, percent):
+    """ Calculates a percentile with the nearest rank method.
+
+    Parameters:
+        values - list. Sorted numbers.
+        percent - number. The percentile, between 0 and 100.
+    Returns:
+        The value at the percentile, or None for an empty list.
+    """
+    if not values:
+        return None
+    rank = int(ceil(percent / 100.0 * len(values))) - 1
+    return values[max(0, min(rank, len(values) - 1))]
+
+
+class MetricsRecorder(object):
+    """ Collects the timings of the pipeline: the wall time of every
+    stage, the requests per remote host and the rows loaded per table.
+    All methods may be called from multiple threads.
+    """
+
+    def __init__(self):
+        self.started = time()
+        self._lock = Lock()
+        self._stages = {}
+        self._hosts = {}
+        self._tables = {}
+
+    @contextmanager
+    def stage(self, name):
+        """ Measures the wall time of the code in the with block. A
+        stage which runs multiple times is added up.
+
+        Parameters:
+            name - string. The name of the stage.
+        """
+        start = time()
+        try:
+            yield
+        finally:
+            seconds = time() - start
+            with self._lock:
+                stage = self._stages.setdefault(name, dict(seconds=0.0,
+                                                           calls=0))
+                stage['seconds'] += seconds
+                stage['calls'] += 1
+
+    def record_request(self, url, size=0, seconds=0.0, cached=False,
+                       error=False):
+        """ Records a single request to a remote host.
+
+        Parameters:
+            url - string. The requested url.
+            size - int. The amount of bytes which were received.
+            seconds - float. The time the request took.
+            cached - boolean. Whether the response came from the cache,
+            in that case the host was not contacted.
+            error - boolean. Whether the request failed.
+        """
+        with self._lock:
+            host = self._hosts.setdefault(urlparse(url).netloc, dict(
+                requests=0, cached=0, errors=0, bytes=0, latencies=[]))
+            if cached:
+                host['cached'] += 1
+                return
+            host['requests'] += 1
+            host['errors'] += bool(error)
+            host['bytes'] += size
+            host['latencies'].append(seconds)
+
+    def record_rows(self, table, rows, seconds):
+        """ Records a load of rows into a table.
+
+        Parameters:
+            table - string. The name of the table.
+            rows - int. The amount of loaded rows.
+            seconds - float. The time the load took.
+        """
+        with self._lock:
+            stats = self._tables.setdefault(table, dict(rows=0, seconds=0.0))
+            stats['rows'] += rows
+            stats['seconds'] += seconds
+
+    def get_report(self):
+        """ Summarizes the collected measurements.
+
+        Returns:
+            A dictionary which can be serialized to JSON.
+        """
+        with self._lock:
+            hosts = {}
+            for name, host in self._hosts.items():
+                latencies = sorted(host['latencies'])
+                summary = dict((key, host[key]) for key in
+                               ('requests', 'cached', 'errors', 'bytes'))
+                summary['latency'] = dict(
+                    ('p{}'.format(percent), percentile(latencies, percent))
+                    for percent in PERCENTILES)
+                summary['latency']['max'] = latencies[-1] if latencies \
+                    else None
+                summary['latency']['total'] = sum(latencies)
+                hosts[name] = summary
+            tables = {}
+            for name, stats in self._tables.items():
+                tables[name] = dict(stats, rows_per_second=(
+                    stats['rows'] / stats['seconds'] if stats['seconds']
+                    else None))
+            return dict(seconds=time() - self.started,
+                        stages=dict((name, dict(stage)) for name, stage
+                                    in self._stages.items()),
+                        hosts=hosts, tables=tables)
+
+    def write_report(self, path):
+        """ Writes the report as JSON to a file.
+
+        Parameters:
+            path - string. The path of the report.
+        """
+        with open(path, 'w') as file:
+            file.write(dumps(self.get_report(), indent=2, sort_keys=True))
+
+
+class NullRecorder(object):
+    """ A recorder which ignores everything, used when the metrics are
+    disabled so the measurements cost nothing.
+    """
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def record_request(self, url, size=0, seconds=0.0, cached=False,
+                       error=False):
+        pass
+
+    def record_rows(self, table, rows, seconds):
+        pass
+
+    def get_report(self):
+        return {}
+
+    def write_report(self, path):
+        pass
+
+
+_recorder = NullRecorder()
+
+
+def enable_metrics():
+    """ Starts collecting metrics with a new MetricsRecorder.
+
+    Returns:
+        The created MetricsRecorder.
+    """
+    global _recorder
+    _recorder = MetricsRecorder()
+    return _recorder
+
+
+def disable_metrics():
+    """ Stops collecting metrics."""
+    global _recorder
+    _recorder = NullRecorder()
+
+
+def get_metrics():
+    """ Returns the active recorder, a NullRecorder when the metrics
+    are disabled.
+    """
+    return _recorder
@@ -0,0 +1,213 @@
+import re
+from bisect import bisect_right
+from struct import Struct
+
+# The code of every base in the packed bytes, 4 bases per byte with the
+# first base in the highest bits
+BASES = 'ACGT'
+# The complement of every IUPAC nucleotide code
+COMPLEMENTS = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A', 'U': 'A', 'N': 'N',
+               'R': 'Y', 'Y': 'R', 'S': 'S', 'W': 'W', 'K': 'M', 'M': 'K',
+               'B': 'V', 'V': 'B', 'D': 'H', 'H': 'D', '-': '-'}
+
+# The binary format: a header with the magic, the version, the length
+# and the amount of runs, the runs and then the packed bases
+MAGIC = b'2B'
+VERSION = 1
+_HEADER = Struct('>2sBII')
+_RUN = Struct('>IIc')
+
+# Every byte decoded to its 4 bases and every 4 bases encoded to a byte
+_DECODE = [''.join(BASES[(byte >> shift) & 3] for shift in (6, 4, 2, 0))
+           for byte in range(256)]
+_ENCODE = dict((bases, byte) for byte, bases in enumerate(_DECODE))
+# Runs of the same character which can not be packed
+_RUN_PATTERN = re.compile(r'([^ACGT])\1*')
+
+
+def is_nucleotide(molecule):
+    """ Checks whether the molecule type of a GenBank record (see
+    genbank_parser) is a nucleotide, like 'DNA', 'mRNA' or 'ss-RNA', so
+    its sequence can be packed. The type is used instead of the letters
+    of the sequence, since a protein can consist of letters which are
+    also nucleotide codes.
+
+    Parameters:
+        molecule - string. The molecule type on the LOCUS line.
+    Returns:
+        True when the molecule is a nucleotide.
+    """
+    return molecule.endswith(('DNA', 'RNA'))
+
+
+def reverse_complement(sequence):
+    """ Returns the reverse complement of an uppercase nucleotide
+    sequence.
+    """
+    return ''.join(COMPLEMENTS[base] for base in reversed(sequence))
+
+
+def get_exon_sequence(sequence, exons):
+    """ Extracts and joins the exons of a coding sequence, like the rows
+    of Exon_07. The exons on the complement strand are reverse
+    complemented and joined from the last to the first, as in
+    complement(join(...)) of GenBank, after the exons on the forward
+    strand.
+
+    Parameters:
+        sequence - string or PackedSequence. The nucleotide sequence.
+        exons - iterable. Tuples with the start and end position of
+        every exon, starting at 1 and including the end (like the
+        positions of GenBank), and whether the exon is on the
+        complement strand.
+    Returns:
+        The coding sequence as string.
+    """
+    exons = list(exons)
+    forward = [sequence[start - 1:end]
+               for start, end, complement in exons if not complement]
+    reverse = [reverse_complement(sequence[start - 1:end])
+               for start, end, complement in reversed(exons) if complement]
+    return ''.join(forward + reverse)
+
+
+class PackedSequence(object):
+    """ A nucleotide sequence stored with 2 bits per base. Characters
+    other than A, C, G and T (like N and the other ambiguity codes) are
+    stored as runs next to the packed bases, in the packed bases they
+    are an A. Any range of the sequence can be extracted by decoding
+    only the bytes which cover it.
+    """
+
+    def __init__(self, packed, length, runs=()):
+        """ Creates a sequence from its packed form, see encode to pack
+        a sequence.
+
+        Parameters:
+            packed - bytes. The packed bases, 4 bases per byte.
+            length - int. The amount of bases.
+            runs - iterable. Tuples with the start, the end (exclusive)
+            and the character of the runs which are not A, C, G or T,
+            ordered by start.
+        """
+        self.packed = bytearray(packed)
+        self.length = length
+        self.runs = list(runs)
+        self._run_starts = [start for start, _, _ in self.runs]
+
+    @classmethod
+    def encode(cls, sequence):
+        """ Packs a nucleotide sequence.
+
+        Parameters:
+            sequence - string. An uppercase nucleotide sequence.
+        Returns:
+            A new PackedSequence.
+        """
+        runs = [(match.start(), match.end(), match.group(1))
+                for match in _RUN_PATTERN.finditer(sequence)]
+        if runs:
+            sequence = _RUN_PATTERN.sub(lambda match: 'A' * len(
+                match.group()), sequence)
+        padded = sequence + 'A' * (-len(sequence) % 4)
+        packed = bytearray(_ENCODE[padded[i:i + 4]]
+                           for i in range(0, len(padded), 4))
+        return cls(packed, len(sequence), runs)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """ Reads a sequence from the binary format of to_bytes.
+
+        Parameters:
+            data - bytes. The binary format, like a BYTEA value (which
+            psycopg2 returns as a buffer or memoryview).
+        Returns:
+            A new PackedSequence.
+        """
+        data = bytes(data)
+        magic, version, length, run_count = _HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Not a packed sequence!')
+        offset = _HEADER.size
+        runs = []
+        for _ in range(run_count):
+            start, end, char = _RUN.unpack_from(data, offset)
+            runs.append((start, end, char.decode()))
+            offset += _RUN.size
+        return cls(data[offset:], length, runs)
+
+    def to_bytes(self):
+        """ Converts the sequence to its binary format, which can be
+        stored in a BYTEA column.
+
+        Returns:
+            The binary format as bytes.
+        """
+        parts = [_HEADER.pack(MAGIC, VERSION, self.length, len(self.runs))]
+        parts.extend(_RUN.pack(start, end, char.encode())
+                     for start, end, char in self.runs)
+        parts.append(bytes(self.packed))
+        return b''.join(parts)
+
+    def get_range(self, start, end):
+        """ Extracts a part of the sequence.
+
+        Parameters:
+            start - int. The first position, starting at 0.
+            end - int. The position after the last position.
+        Returns:
+            The part of the sequence as string.
+        """
+        start, end = max(0, start), min(self.length, end)
+        if start >= end:
+            return ''
+        first = start // 4
+        bases = ''.join([_DECODE[byte] for byte in
+                         self.packed[first:(end + 3) // 4]])
+        offset = first * 4
+        bases = bases[start - offset:end - offset]
+        # Put back the runs which overlap with the range
+        index = max(0, bisect_right(self._run_starts, start) - 1)
+        if index >= len(self.runs) or self.runs[-1][1] <= start:
+            return bases
+        chars = list(bases)
+        for run_start, run_end, char in self.runs[index:]:
+            if run_start >= end:
+                break
+            run_start, run_end = max(run_start, start), min(run_end, end)
+            if run_start < run_end:
+                chars[run_start - start:run_end - start] = \
+                    char * (run_end - run_start)
+        return ''.join(chars)
+
+    def get_exons(self, exons):
+        """ Extracts and joins the exons of a coding sequence, only the
+        bytes which cover the exons are decoded. See get_exon_sequence.
+        """
+        return get_exon_sequence(self, exons)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, end, step = index.indices(self.length)
+            if step != 1:
+                return str(self)[index]
+            return self.get_range(start, end)
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('Position out of range')
+        return self.get_range(index, index + 1)
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        return self.get_range(0, self.length)
+
+    def __eq__(self, other):
+        return isinstance(other, PackedSequence) and \
+            (self.length, self.runs, self.packed) == \
+            (other.length, other.runs, other.packed)
+
+    def __ne__(self, other):
+        return not self == other
@@ -0,0 +1,139 @@
+from re import compile, IGNORECASE
+from threading import Thread
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+from metrics import get_metrics
+
+# The amount of tables which are loaded at the same time
+LOAD_WORKERS = 4
+
+_TABLE_PATTERN = compile(r'\b(?:CREATE|ALTER)\s+TABLE\s+(?:IF\s+(?:NOT\s+)?'
+                         r'EXISTS\s+)?(\w+)', IGNORECASE)
+_REFERENCE_PATTERN = compile(r'\bREFERENCES\s+(\w+)', IGNORECASE)
+
+
+def parse_dependencies(sql):
+    """ Collects the foreign keys of a schema. Both the foreign keys in
+    CREATE TABLE statements and those added with ALTER TABLE are found.
+
+    Parameters:
+        sql - string. The SQL statements of the schema.
+    Returns:
+        A dictionary with the (lowercase) table names as keys and a set
+        of the tables they reference as values.
+    """
+    dependencies = {}
+    for statement in sql.split(';'):
+        table = _TABLE_PATTERN.search(statement)
+        if table is None:
+            continue
+        name = table.group(1).lower()
+        references = dependencies.setdefault(name, set())
+        for reference in _REFERENCE_PATTERN.findall(statement):
+            if reference.lower() != name:
+                references.add(reference.lower())
+    return dependencies
+
+
+def read_dependencies(*paths):
+    """ Collects the foreign keys of the schema files, see
+    parse_dependencies.
+    """
+    dependencies = {}
+    for path in paths:
+        with open(path, 'r') as file:
+            for table, references in parse_dependencies(file.read()).items():
+                dependencies.setdefault(table, set()).update(references)
+    return dependencies
+
+
+class ParallelLoader(object):
+    """ Loads multiple tables at the same time, each over its own
+    connection of a pool. A table is only loaded after the tables it
+    references have been loaded and committed, so the foreign keys are
+    always satisfied.
+    """
+
+    def __init__(self, pool, dependencies, workers=LOAD_WORKERS):
+        """ Creates the loader.
+
+        Parameters:
+            pool - A connection pool with getconn and putconn methods,
+            like psycopg2.pool.ThreadedConnectionPool.
+            dependencies - dictionary. The referenced tables of every
+            table, see parse_dependencies.
+            workers - int. The amount of tables which are loaded at the
+            same time. Should not exceed the size of the pool.
+        """
+        self.pool = pool
+        self.dependencies = dependencies
+        self.workers = max(1, workers)
+
+    def _load(self, table, load, results):
+        """ Loads a single table and commits it. The result is put in
+        the results queue as a tuple with the table and the error, which
+        is None on success.
+        """
+        error = None
+        connection = self.pool.getconn()
+        try:
+            with get_metrics().stage('load_' + table):
+                load(connection.cursor())
+                connection.commit()
+        except Exception as exception:
+            connection.rollback()
+            error = exception
+        finally:
+            self.pool.putconn(connection)
+        results.put((table, error))
+
+    def run(self, loads, on_loaded=None):
+        """ Runs the loads of the tables. When a load fails, no new
+        loads are started and the error is raised once the running
+        loads have finished. The loads which have finished are
+        committed.
+
+        Parameters:
+            loads - dictionary. The table names as keys and functions
+            which load the table with a given cursor as values, like
+            the loads of create_load in insert_data. References to
+            tables which are not in the loads are considered loaded.
+            on_loaded - callable. Called with the name of every table
+            which has been loaded and committed.
+        """
+        pending = dict(loads)
+        names = {table.lower() for table in pending}
+        loaded = set()
+        results = Queue()
+        running = 0
+        error = None
+        while pending or running:
+            if error is None:
+                for table in sorted(pending):
+                    if running >= self.workers:
+                        break
+                    references = self.dependencies.get(table.lower(), set())
+                    if references & names <= loaded:
+                        thread = Thread(target=self._load, args=(
+                            table, pending.pop(table), results))
+                        thread.daemon = True
+                        thread.start()
+                        running += 1
+            if not running:
+                if error is None and pending:
+                    error = ValueError('The foreign keys of {} form a cycle'
+                                       .format(', '.join(sorted(pending))))
+                break
+            table, table_error = results.get()
+            running -= 1
+            if table_error is not None:
+                error = error or table_error
+                continue
+            loaded.add(table.lower())
+            if on_loaded is not None:
+                on_loaded(table)
+        if error is not None:
+            raise error
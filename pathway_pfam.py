@@ -1,9 +1,9 @@
-try:
-    import urllib.request as urllib
-except ImportError:
-    import urllib
+from io import BytesIO
 from re import split, search
-from utils import get_line
+from checkpoint import resume_map
+from entity_registry import EntityRegistry
+from utils import get_line, open_url, fetch_all, get_kegg_records, \
+    KEGG_GET_URL
 from collections import OrderedDict
 
 
@@ -19,7 +19,18 @@ def get_pathways_pfams(asncode):
         A list of pathway asn codes, and a list of pfam families.
     """
     # Do the API call
-    connection = urllib.urlopen('http://rest.kegg.jp/get/' + asncode)
+    return read_pathways_pfams(open_url(KEGG_GET_URL + asncode))
+
+
+def read_pathways_pfams(connection):
+    """ Reads the asn codes of the pathways and the pfam families from
+    the KEGG record of a gene.
+
+    Parameters:
+        connection - A file-like object. The KEGG record of the gene.
+    Returns:
+        A list of pathway asn codes, and a list of pfam families.
+    """
     pathways = []
     # Read until the line
     pathway_line = get_line(connection, 'PATHWAY')
@@ -69,8 +80,20 @@ def get_pathway_data(asn_pathway_code):
     Returns:
         A dictionary with the collected information.
     """
-    connection = urllib.urlopen(
-        'http://rest.kegg.jp/get/path:' + asn_pathway_code)
+    return read_pathway_data(
+        open_url(KEGG_GET_URL + 'path:' + asn_pathway_code))
+
+
+def read_pathway_data(connection):
+    """ Reads the name, class and publications from the KEGG record of
+    a pathway.
+
+    Parameters:
+        connection - A file-like object. The KEGG record of the
+        pathway.
+    Returns:
+        A dictionary with the collected information.
+    """
     # Collect the general data of the pathway
     collected_data = {'name': get_line(connection, 'NAME'),
                       'class': get_line(connection, 'CLASS'),
@@ -103,8 +126,8 @@ def get_pfam_data(pfam):
             - av_coverage (average coverage)
     """
     # Read the xml
-    connection = urllib.urlopen('http://pfam.xfam.org/family/{}?output=xml'
-                                .format(pfam))
+    connection = open_url('http://pfam.xfam.org/family/{}?output=xml'
+                          .format(pfam))
     xml = connection.read().decode()
     connection.close()
     # Get the data
@@ -119,49 +142,98 @@ def get_pfam_data(pfam):
     return pfam_data
 
 
-def get_pathway_pfam_data(proteincode_kegg):
+def get_pathway_pfam_data(proteincode_kegg, workers=1, known_pathways=(),
+                          known_domains=(), progress=None):
     """ Downloads all the data and stores this for the pathway and
     domain data. This is done in an efficient way: a file is only
     downloaded once which reduses the execution time of the complete
-    script since there is less to be downloaded.
+    script since there is less to be downloaded. When more than 1
+    worker is given, the downloads are done concurrently.
 
     Parameters:
         proteincode_kegg - dictionary. The dictionary containing
         proteincodes as keys and kegg asn numbers as values.
+        workers - int. The amount of downloads which may run at the
+        same time.
+        known_pathways - collection. The asn codes of pathways which
+        are already stored and thus are not downloaded again.
+        known_domains - collection. The names of domains which are
+        already stored and thus are not downloaded again.
+        progress - StageProgress object. When given, every finished
+        gene, pathway and domain is recorded in it, so an interrupted
+        run can be resumed.
     Return:
         pathway - dictionary. The keys represent the asn code for the
         pathway and the value is another dictionary with the name,
-        class and publications.
+        class and publications. Known pathways have None as value,
+        pathways which KEGG does not return are left out.
         pathway_links - dictionary. The keys represent a proteincode
         and the values are the asn codes for the pathways.
         domains - dictionary. The keys represent the name of a domain
         and the values are dictionaries with the information associated
-        with that domain.
+        with that domain. Known domains have None as value.
         domain_links - dictionary. The keys represent the proteincode
         and the value is the correct index to the correct domain in the
         database.
     """
-    stored_pathways, stored_domains = [], []
+    # The pathways and domains in the order they are found, the key of a
+    # domain is its place in that order
+    stored_pathways, stored_domains = EntityRegistry(), EntityRegistry()
     pathway, domains = {}, OrderedDict()
     pathway_links, domain_links = {}, {}
+
+    def read_gene_batch(entries):
+        records = get_kegg_records(entries, workers)
+        # Genes which KEGG does not return have no pathways and domains
+        return [read_pathways_pfams(BytesIO(records[entry]))
+                if entry in records else ([], []) for entry in entries]
+
+    def read_pathway_batch(entries):
+        records = get_kegg_records(entries, workers)
+        # Pathways which KEGG does not return are None
+        return [read_pathway_data(BytesIO(records[entry]))
+                if entry in records else None for entry in entries]
+
+    def read_domain_batch(entries):
+        return fetch_all(get_pfam_data, [entry.split(':')[1]
+                                         for entry in entries], workers)
+
+    # The gene records are retrieved in batches
+    gene_data = resume_map(read_gene_batch, proteincode_kegg.values(),
+                           progress)
     # handle each protein code
     for protein_code in proteincode_kegg:
-        pathway_list, pfam_list = get_pathways_pfams(
-            proteincode_kegg[protein_code])
+        pathway_list, pfam_list = gene_data[proteincode_kegg[protein_code]]
         # Handle pathway data
         pathway_links[protein_code] = pathway_list
         for pcode in pathway_list:
-            if pcode not in stored_pathways:
-                pathway[pcode] = get_pathway_data(pcode)
-                stored_pathways.append(pcode)
+            stored_pathways.intern(pcode)
         # Handle Pfam data
-        domain_links[protein_code] = []
-        for pfam in pfam_list:
-            if pfam not in stored_domains:
-                stored_domains.append(pfam)
-                domains[pfam] = get_pfam_data(pfam)
-                domain_links[protein_code].append(len(stored_domains))
-            else:
-                domain_links[protein_code].append(stored_domains.index(pfam) +
-                                                  1)
+        domain_links[protein_code] = [stored_domains.intern(pfam)
+                                      for pfam in pfam_list]
+    # Download every new pathway and domain only once
+    new_pathways = [pcode for pcode in stored_pathways
+                    if pcode not in known_pathways]
+    pathway_data = resume_map(read_pathway_batch, ['path:' + pcode
+                                                   for pcode in new_pathways],
+                              progress)
+    # Leave out the pathways which do not exist and the links to them
+    missing = {pcode for pcode in new_pathways
+               if pathway_data['path:' + pcode] is None}
+    for pcode in stored_pathways:
+        if pcode not in missing:
+            pathway[pcode] = pathway_data.get('path:' + pcode)
+    if missing:
+        for protein_code in pathway_links:
+            pathway_links[protein_code] = [
+                pcode for pcode in pathway_links[protein_code]
+                if pcode not in missing]
+    new_domains = [pfam for pfam in stored_domains
+                   if pfam not in known_domains]
+    domain_data = resume_map(read_domain_batch, ['pfam:' + pfam
+                                                 for pfam in new_domains],
+                             progress)
+    # Keep the order of the stored domains, the links depend on it
+    for pfam in stored_domains:
+        domains[pfam] = domain_data.get('pfam:' + pfam)
     return pathway, pathway_links, domains, domain_links
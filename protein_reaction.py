@@ -1,89 +1,90 @@
-try:
-    import urllib.request as urllib
-except ImportError:
-    import urllib
+from io import BytesIO
 from re import split
-from utils import get_line
+from checkpoint import resume_map
+from linkdb import extract_link_ids
+from utils import get_line, open_url, fetch_all, get_kegg_records, \
+    KEGG_GET_URL
 
 
-def reaction_number(proteincode_kegg):
+def reaction_number(proteincode_kegg, workers=1, progress=None):
     """ Every kegg proteincode will be used to find all reaction
     numbers by parsing a HTML file. This HTML file contains the R codes
-    specific for the protein.
+    specific for the protein and is parsed by linkdb.
 
     Parameters:
         proteincode_kegg - dictionary. A dictionary with proteincodes
         as keys and kegg proteincodes as values.
+        workers - int. The amount of downloads which may run at the
+        same time.
+        progress - StageProgress object. When given, the reactions of
+        every finished protein are recorded in it and proteins which
+        were finished before are not downloaded again.
     Returns:
         A dictionary containing proteincodes as keys and as values
         there will be a list with Rcodes.
     """
+    def read_batch(proteincodes):
+        html_texts = fetch_all(get_linkdb_html,
+                               [proteincode_kegg[proteincode]
+                                for proteincode in proteincodes], workers)
+        return [extract_link_ids(html_text, 'reaction')
+                for html_text in html_texts]
+
+    protein_reactions = resume_map(read_batch, proteincode_kegg, progress)
     dict_reactions = {}
     for proteincode in proteincode_kegg:
-        html_file = urllib.urlopen("http://www.genome.jp/dbget-bin/get_linkdb?"
-                                   "-t+reaction+" +
-                                   proteincode_kegg[proteincode])
-        html_text = html_file.read().decode()
-        html_file.close()
-        list_reactions = search_reaction_nr(html_text)
-        for i in range(len(list_reactions)):
-            dict_reactions[proteincode] = list_reactions
+        # Only proteins with reactions are linked
+        if protein_reactions[proteincode]:
+            dict_reactions[proteincode] = protein_reactions[proteincode]
     return dict_reactions
 
 
-def search_reaction_nr(html_text):
-    """ This function actually searches for the reaction number and
-    collects them.
+def get_linkdb_html(kegg_proteincode):
+    """ Downloads the HTML file which links the KEGG proteincode to its
+    reactions.
 
     Parameters:
-        html_text - string. The text of the HTML file which contains
-        Rcodes.
+        kegg_proteincode - string. The KEGG proteincode.
     Returns:
-        A list of reaction numbers which can be used in the KEGG API.
+        The text of the HTML file.
     """
-    tag = False
-    collection = ""
-    all_reactions = []
-    reaction_nr = ""
-    for char in html_text:
-        if char == '>' and not tag:
-            collection = ""
-        else:
-            collection += char
-        if collection == 'R' and not tag:
-            tag = True
-        tag, reaction_nr, all_reactions = tag_reaction_nr(char, tag,
-                                                          all_reactions,
-                                                          reaction_nr)
-    return all_reactions
-
-
-def tag_reaction_nr(char, tag, all_reactions, reaction_nr):
-    """ Whenever a specific part in the html code is tagged
-    (tag = True), add all of the following characters (char) to the
-    string reaction_nr.
+    html_file = open_url("http://www.genome.jp/dbget-bin/get_linkdb?"
+                         "-t+reaction+" + kegg_proteincode)
+    html_text = html_file.read().decode()
+    html_file.close()
+    return html_text
+
+
+def get_reaction(rcode):
+    """ Retrieves the definition and enzyme codes of a reaction from
+    the KEGG API.
 
     Parameters:
-        tag - boolean. Indicates when text is tagged.
-        char - string. Character in text.
-        reaction_nr - string. Contains the reaction number.
-        all_reactions - list. Contains all reaction numbers.
+        rcode - string. The reaction code.
     Returns:
-        tag - boolean.
-        reaction_nr - string.
-        all_reactions - list.
+        A dictionary with 'reaction', 'ec' and 'id' as keys.
     """
-    if tag:
-        if char != "<":
-            reaction_nr += char
-        else:
-            all_reactions.append(reaction_nr)
-            reaction_nr = ""
-            tag = False
-    return tag, reaction_nr, all_reactions
+    return read_reaction(open_url(KEGG_GET_URL + 'reaction:' + rcode), rcode)
+
 
+def read_reaction(kegg_api, rcode):
+    """ Reads the definition and enzyme codes from the KEGG record of a
+    reaction.
 
-def get_reaction_data(proteincode_kegg):
+    Parameters:
+        kegg_api - File-like object. The KEGG record of the reaction.
+        rcode - string. The reaction code.
+    Returns:
+        A dictionary with 'reaction', 'ec' and 'id' as keys.
+    """
+    reaction_line = get_line(kegg_api, 'DEFINITION')
+    ec = split('\s+', get_line(kegg_api, 'ENZYME'))
+    kegg_api.close()
+    return dict(reaction=reaction_line, ec=ec, id=rcode)
+
+
+def get_reaction_data(proteincode_kegg, workers=1, known_reactions=(),
+                      progress=None):
     """ This is the main function which handles all functions in this
     file. It takes a dictionary with proteincodes and KEGG proteincodes
     and converts this in a dictionary with proteincodes linked to the
@@ -92,29 +93,54 @@ def get_reaction_data(proteincode_kegg):
     Parameters:
         proteincode_kegg - dictionary. A dictionary with proteincodes
         as keys and KEGG proteincodes as values.
+        workers - int. The amount of downloads which may run at the
+        same time.
+        known_reactions - collection. The rcodes of reactions which are
+        already stored and thus are not downloaded again.
+        progress - StageProgress object. When given, every finished
+        protein and reaction is recorded in it, so an interrupted run
+        can be resumed.
     Returns:
         1. A dictionary with proteincodes as keys and reaction codes as
         values. This represents the linkage between proteins and
         reactions.
         2. A dictionary with rcodes as keys and a dictionary with
         'reaction', 'ec' and 'id' as keys and thus contains the
-        information for the reactions.
+        information for the reactions. Known reactions are left out.
+        Reactions which KEGG does not return are left out of both
+        dictionaries.
     """
-    proteincodes_rcodes = reaction_number(proteincode_kegg)
+    proteincodes_rcodes = reaction_number(proteincode_kegg, workers, progress)
     proteincode_reaction = {}
-    reaction = {}
+    rcodes, seen_rcodes = [], set()
     for proteincode in proteincodes_rcodes:
         proteincode_reaction[proteincode] = []
         # Get all reactions for this code
         for rcode in proteincodes_rcodes[proteincode]:
-            if rcode not in reaction:
-                kegg_api = urllib.urlopen("http://rest.kegg.jp/get/reaction:{}"
-                                          .format(rcode))
-                reaction_line = get_line(kegg_api, 'DEFINITION')
-                ec = split('\s+', get_line(kegg_api, 'ENZYME'))
-                kegg_api.close()
-                reaction[rcode] = dict(reaction=reaction_line, ec=ec, id=rcode)
-            if proteincode not in proteincode_reaction:
-                proteincode_reaction[proteincode] = []
+            if rcode not in seen_rcodes and rcode not in known_reactions:
+                seen_rcodes.add(rcode)
+                rcodes.append(rcode)
             proteincode_reaction[proteincode].append(rcode)
+
+    def read_batch(entries):
+        records = get_kegg_records(entries, workers)
+        # Reactions which KEGG does not return are None
+        return [read_reaction(BytesIO(records[entry]), entry.split(':')[1])
+                if entry in records else None for entry in entries]
+
+    # Every reaction is downloaded only once, in batches
+    reaction_data = resume_map(read_batch, ['reaction:' + rcode
+                                            for rcode in rcodes], progress)
+    reaction = {}
+    for rcode in rcodes:
+        if reaction_data['reaction:' + rcode] is not None:
+            reaction[rcode] = reaction_data['reaction:' + rcode]
+    # Leave out the links to the reactions which do not exist
+    missing = set(rcodes) - set(reaction)
+    for proteincode in list(proteincode_reaction):
+        proteincode_reaction[proteincode] = [
+            rcode for rcode in proteincode_reaction[proteincode]
+            if rcode not in missing]
+        if not proteincode_reaction[proteincode]:
+            del proteincode_reaction[proteincode]
     return proteincode_reaction, reaction
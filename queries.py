@@ -0,0 +1,416 @@
+from collections import OrderedDict, namedtuple
+from itertools import count
+from threading import Lock
+
+from packed_sequence import PackedSequence, get_exon_sequence
+
+# The amount of query results which are kept in memory
+CACHE_SIZE = 1024
+# The amount of rows a server side cursor retrieves per round trip
+ITER_SIZE = 2000
+# The channel which is notified when insert_data has finished loading,
+# which invalidates the cached results of every listening client
+LOAD_CHANNEL = 'data_loaded'
+
+Gene = namedtuple('Gene', ('gen_id', 'gen_naam', 'accession_code',
+                           'gen_sequentie'))
+Exon = namedtuple('Exon', ('exon_id', 'gen_id', 'start_positie',
+                           'eind_positie', 'complement'))
+Protein = namedtuple('Protein', ('eiwit_id', 'gen_id', 'eiwit_naam',
+                                 'eiwit_sequentie'))
+Reaction = namedtuple('Reaction', ('reactie_id', 'reactie', 'reactie_ec'))
+Pathway = namedtuple('Pathway', ('pathway_id', 'pathway_naam',
+                                 'pathway_class'))
+Domain = namedtuple('Domain', ('domein_id', 'domein_naam',
+                               'gem_domein_lengte', 'gem_alignment_coverage',
+                               'gem_sequentie_coverage'))
+Reference = namedtuple('Reference', ('referentie_id', 'pathway_id', 'titel',
+                                     'journal', 'auteurs'))
+GeneAnnotation = namedtuple('GeneAnnotation', ('gene', 'exons', 'proteins'))
+ProteinAnnotation = namedtuple('ProteinAnnotation', (
+    'protein', 'pathways', 'reactions', 'domains', 'references'))
+
+# The NUMERIC(9, 0) ids are selected as integers
+_GENE_COLUMNS = 'g.gen_id::integer, g.gen_naam, g.accession_code, ' \
+                'g.gen_sequentie, g.gen_sequentie_2bit'
+_EXON_COLUMNS = 'x.exon_id, x.gen_id::integer, x.start_positie, ' \
+                'x.eind_positie, x.complement'
+_PROTEIN_COLUMNS = 'e.eiwit_id::integer, e.gen_id::integer, e.eiwit_naam, ' \
+                   'e.eiwit_sequentie'
+# The authors of a reference, in the order they were stored
+_REFERENCE_COLUMNS = 'r.referentie_id, r.pathway_id, r.titel, r.journal, ' \
+                     'array_remove(array_agg(a.auteur_naam ORDER BY ' \
+                     'a.auteur_id), NULL)'
+_REFERENCE_JOINS = 'LEFT JOIN ReferentieAuteur_07 ra USING (referentie_id) ' \
+                   'LEFT JOIN Auteur_07 a USING (auteur_id)'
+_REFERENCE_GROUP = 'GROUP BY r.referentie_id, r.pathway_id, r.titel, ' \
+                   'r.journal ORDER BY r.pathway_id, r.referentie_id'
+
+
+def _make_gene(row):
+    """ Creates a Gene of a row with both sequence columns. A packed
+    sequence is returned as PackedSequence, so parts of it can be
+    extracted without decoding it completely.
+    """
+    gen_id, gen_naam, accession_code, sequence, packed = row
+    if packed is not None:
+        sequence = PackedSequence.from_bytes(packed)
+    return Gene(gen_id, gen_naam, accession_code, sequence)
+
+
+# The lookups which are prepared on the server, with the function which
+# creates their rows. The single parameter is $1.
+QUERIES = {
+    'gene': (
+        'SELECT {} FROM Gen_07 g WHERE g.gen_id = $1'.format(_GENE_COLUMNS),
+        _make_gene),
+    'gene_by_accession': (
+        'SELECT {} FROM Gen_07 g WHERE g.accession_code = $1'.format(
+            _GENE_COLUMNS), _make_gene),
+    'gene_exons': (
+        'SELECT {} FROM Exon_07 x WHERE x.gen_id = $1 '
+        'ORDER BY x.start_positie, x.exon_id'.format(_EXON_COLUMNS),
+        Exon._make),
+    'gene_proteins': (
+        'SELECT {} FROM Eiwit_07 e WHERE e.gen_id = $1 '
+        'ORDER BY e.eiwit_id'.format(_PROTEIN_COLUMNS), Protein._make),
+    'protein': (
+        'SELECT {} FROM Eiwit_07 e WHERE e.eiwit_id = $1'.format(
+            _PROTEIN_COLUMNS), Protein._make),
+    'protein_pathways': (
+        'SELECT p.pathway_id, p.pathway_naam, p.class '
+        'FROM EiwitPathway_07 ep JOIN Pathway_07 p USING (pathway_id) '
+        'WHERE ep.eiwit_id = $1 ORDER BY p.pathway_id', Pathway._make),
+    'protein_reactions': (
+        'SELECT r.reactie_id, r.reactie, r.reactie_ec '
+        'FROM EiwitReactie_07 er JOIN Reactie_07 r USING (reactie_id) '
+        'WHERE er.eiwit_id = $1 ORDER BY r.reactie_id', Reaction._make),
+    'protein_domains': (
+        'SELECT d.domein_id, d.domein_naam, d.gem_domein_lengte, '
+        'd.gem_alignment_coverage, d.gem_sequentie_coverage '
+        'FROM EiwitDomein_07 ed JOIN Domein_07 d USING (domein_id) '
+        'WHERE ed.eiwit_id = $1 ORDER BY d.domein_naam', Domain._make),
+    'pathway_references': (
+        'SELECT {} FROM Referentie_07 r {} WHERE r.pathway_id = $1 {}'.format(
+            _REFERENCE_COLUMNS, _REFERENCE_JOINS, _REFERENCE_GROUP),
+        Reference._make),
+    'protein_references': (
+        'SELECT {} FROM EiwitPathway_07 ep JOIN Referentie_07 r '
+        'ON r.pathway_id = ep.pathway_id {} WHERE ep.eiwit_id = $1 {}'.format(
+            _REFERENCE_COLUMNS, _REFERENCE_JOINS, _REFERENCE_GROUP),
+        Reference._make)
+}
+
+
+class LRUCache(object):
+    """ Keeps the most recently used values in memory. Every clear
+    starts a new generation, and values which were retrieved in an
+    older generation are not stored, so a result which was queried
+    while the data changed is never cached. The cache may be used from
+    multiple threads.
+    """
+
+    def __init__(self, max_size=CACHE_SIZE):
+        """ Creates an empty cache.
+
+        Parameters:
+            max_size - int. The maximum amount of values.
+        """
+        self.max_size = max_size
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        """ Retrieves a value and marks it as the most recently used.
+
+        Returns:
+            The value, or None when the key is not cached.
+        """
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return None
+            self.hits += 1
+            value = self._items.pop(key)
+            self._items[key] = value
+            return value
+
+    def set(self, key, value, generation):
+        """ Stores a value, the least recently used value is removed
+        when the cache is full.
+
+        Parameters:
+            key - The key, any hashable value.
+            value - The value to store.
+            generation - int. The generation the value was retrieved in.
+        """
+        with self._lock:
+            if generation != self.generation or self.max_size < 1:
+                return
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        """ Removes all values and starts a new generation."""
+        with self._lock:
+            self._items.clear()
+            self.generation += 1
+
+    def __len__(self):
+        return len(self._items)
+
+
+class QueryClient(object):
+    """ Looks up the data which was loaded by insert_data. The lookups
+    are prepared statements, which are parsed and planned only once per
+    connection, and their results are cached in an LRUCache. The cache
+    is cleared when a NOTIFY on LOAD_CHANNEL arrives, see notify_loaded.
+    Large results are streamed with server side cursors and are not
+    cached. The client may be used from multiple threads.
+    """
+
+    def __init__(self, connection, cache_size=CACHE_SIZE, listen=True):
+        """ Creates the client. The connection is switched to autocommit,
+        so no transaction stays open between the lookups and the
+        notifications are delivered.
+
+        Parameters:
+            connection - Connection object. A psycopg2 connection which
+            is only used by this client.
+            cache_size - int. The maximum amount of cached results, 0
+            disables the cache.
+            listen - boolean. Whether the cache is cleared when a load
+            has finished.
+        """
+        connection.autocommit = True
+        self.connection = connection
+        self.cache = LRUCache(cache_size)
+        self._prepared = set()
+        self._cursor_ids = count()
+        self._lock = Lock()
+        if listen:
+            cursor = connection.cursor()
+            cursor.execute('LISTEN {};'.format(LOAD_CHANNEL))
+            cursor.close()
+        self.listen = listen
+
+    def _check_notifications(self):
+        """ Clears the cache when a load has finished since the last
+        check. This does not need a round trip to the server.
+        """
+        if not self.listen:
+            return
+        with self._lock:
+            self.connection.poll()
+            if not self.connection.notifies:
+                return
+            del self.connection.notifies[:]
+        self.cache.clear()
+
+    def _fetch(self, name, *parameters):
+        """ Runs a query of QUERIES, or retrieves its cached result.
+
+        Parameters:
+            name - string. The name of the query.
+            parameters - The values of the parameters of the query.
+        Returns:
+            A tuple with the rows, created by the function of the query.
+        """
+        self._check_notifications()
+        key = (name,) + parameters
+        rows = self.cache.get(key)
+        if rows is not None:
+            return rows
+        generation = self.cache.generation
+        sql, make = QUERIES[name]
+        with self._lock:
+            cursor = self.connection.cursor()
+            try:
+                if name not in self._prepared:
+                    cursor.execute('PREPARE {} AS {};'.format(name, sql))
+                    self._prepared.add(name)
+                cursor.execute('EXECUTE {} ({});'.format(
+                    name, ', '.join(['%s'] * len(parameters))), parameters)
+                rows = tuple(make(row) for row in cursor.fetchall())
+            finally:
+                cursor.close()
+        self.cache.set(key, rows, generation)
+        return rows
+
+    def _fetch_one(self, name, *parameters):
+        rows = self._fetch(name, *parameters)
+        return rows[0] if rows else None
+
+    def invalidate(self):
+        """ Clears the cached results."""
+        self.cache.clear()
+
+    def get_gene(self, gene_id):
+        """ Retrieves a Gene by its id, or None when it does not exist.
+        """
+        return self._fetch_one('gene', int(gene_id))
+
+    def get_gene_by_accession(self, accession):
+        """ Retrieves a Gene by its accession code, or None when it does
+        not exist.
+        """
+        return self._fetch_one('gene_by_accession', accession)
+
+    def get_gene_exons(self, gene_id):
+        """ Retrieves the Exons of a gene, ordered by position."""
+        return self._fetch('gene_exons', int(gene_id))
+
+    def get_gene_proteins(self, gene_id):
+        """ Retrieves the Proteins encoded by a gene."""
+        return self._fetch('gene_proteins', int(gene_id))
+
+    def get_gene_annotation(self, accession):
+        """ Retrieves a gene with its exons and proteins.
+
+        Parameters:
+            accession - string. The accession code of the gene.
+        Returns:
+            A GeneAnnotation, or None when the gene does not exist.
+        """
+        gene = self.get_gene_by_accession(accession)
+        if gene is None:
+            return None
+        return GeneAnnotation(gene, self.get_gene_exons(gene.gen_id),
+                              self.get_gene_proteins(gene.gen_id))
+
+    def get_gene_exon_sequence(self, gene_id):
+        """ Extracts and joins the exons of a gene from its sequence,
+        see packed_sequence.get_exon_sequence. When the sequence is
+        packed, only the bytes which cover the exons are decoded.
+
+        Parameters:
+            gene_id - int. The id of the gene.
+        Returns:
+            The joined exons as string, or None when the gene does not
+            exist.
+        """
+        gene = self.get_gene(gene_id)
+        if gene is None:
+            return None
+        return get_exon_sequence(gene.gen_sequentie or '', [
+            (exon.start_positie, exon.eind_positie, exon.complement)
+            for exon in self.get_gene_exons(gene_id)])
+
+    def get_protein(self, protein_id):
+        """ Retrieves a Protein by its id (the GI number), or None when
+        it does not exist.
+        """
+        return self._fetch_one('protein', int(protein_id))
+
+    def get_protein_pathways(self, protein_id):
+        """ Retrieves the Pathways of a protein."""
+        return self._fetch('protein_pathways', int(protein_id))
+
+    def get_protein_reactions(self, protein_id):
+        """ Retrieves the Reactions of a protein."""
+        return self._fetch('protein_reactions', int(protein_id))
+
+    def get_protein_domains(self, protein_id):
+        """ Retrieves the Domains of a protein."""
+        return self._fetch('protein_domains', int(protein_id))
+
+    def get_protein_references(self, protein_id):
+        """ Retrieves the References, with their authors, of all the
+        pathways of a protein.
+        """
+        return self._fetch('protein_references', int(protein_id))
+
+    def get_pathway_references(self, pathway_id):
+        """ Retrieves the References, with their authors, of a pathway.
+        """
+        return self._fetch('pathway_references', pathway_id)
+
+    def get_protein_annotation(self, protein_id):
+        """ Retrieves a protein with its pathways, reactions, domains
+        and references.
+
+        Parameters:
+            protein_id - int. The id (GI number) of the protein.
+        Returns:
+            A ProteinAnnotation, or None when the protein does not
+            exist.
+        """
+        protein = self.get_protein(protein_id)
+        if protein is None:
+            return None
+        return ProteinAnnotation(
+            protein, self.get_protein_pathways(protein_id),
+            self.get_protein_reactions(protein_id),
+            self.get_protein_domains(protein_id),
+            self.get_protein_references(protein_id))
+
+    def _iterate(self, sql, make, parameters=(), itersize=ITER_SIZE):
+        """ Streams the rows of a query with a server side cursor, so
+        only itersize rows are in memory at once. The cursor is held
+        over the transaction, since the connection is in autocommit.
+        The lock is only held while talking to the server, so other
+        lookups can run between the batches.
+
+        Returns:
+            A generator which yields the rows created by make.
+        """
+        with self._lock:
+            cursor = self.connection.cursor(
+                'query_{}'.format(next(self._cursor_ids)), withhold=True)
+            try:
+                cursor.execute(sql, parameters)
+            except Exception:
+                cursor.close()
+                raise
+        try:
+            while True:
+                with self._lock:
+                    rows = cursor.fetchmany(itersize)
+                if not rows:
+                    break
+                for row in rows:
+                    yield make(row)
+        finally:
+            with self._lock:
+                cursor.close()
+
+    def iter_genes(self, itersize=ITER_SIZE):
+        """ Streams all Genes, ordered by id."""
+        return self._iterate('SELECT {} FROM Gen_07 g ORDER BY g.gen_id;'
+                             .format(_GENE_COLUMNS), _make_gene, (),
+                             itersize)
+
+    def iter_proteins(self, itersize=ITER_SIZE):
+        """ Streams all Proteins, ordered by id."""
+        return self._iterate('SELECT {} FROM Eiwit_07 e ORDER BY e.eiwit_id;'
+                             .format(_PROTEIN_COLUMNS), Protein._make, (),
+                             itersize)
+
+    def iter_pathway_proteins(self, pathway_id, itersize=ITER_SIZE):
+        """ Streams the Proteins of a pathway, ordered by id."""
+        return self._iterate(
+            'SELECT {} FROM EiwitPathway_07 ep JOIN Eiwit_07 e USING '
+            '(eiwit_id) WHERE ep.pathway_id = %s ORDER BY e.eiwit_id;'
+            .format(_PROTEIN_COLUMNS), Protein._make, (pathway_id,),
+            itersize)
+
+    def close(self):
+        """ Closes the connection, which also removes the prepared
+        statements.
+        """
+        self.connection.close()
+
+
+def notify_loaded(cursor):
+    """ Tells the listening QueryClients that the data has changed. The
+    notification is delivered when the transaction is committed.
+
+    Parameters:
+        cursor - Cursor object. The cursor to execute queries with.
+    """
+    cursor.execute('NOTIFY {};'.format(LOAD_CHANNEL))
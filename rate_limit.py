@@ -0,0 +1,215 @@
+from random import uniform
+from socket import timeout
+from threading import Lock
+from time import sleep, time
+try:
+    from http.client import HTTPException
+    from urllib.error import HTTPError, URLError
+except ImportError:
+    from httplib import HTTPException
+    from urllib2 import HTTPError, URLError
+
+# The requests per second every host starts with. The rate adapts to
+# the responses of the host, within MIN_RATE and MAX_RATE.
+DEFAULT_RATES = {
+    'rest.kegg.jp': 3.0,
+    'www.genome.jp': 3.0,
+    'pfam.xfam.org': 5.0,
+    'biodbnet-abcc.ncifcrf.gov': 2.0,
+    'eutils.ncbi.nlm.nih.gov': 3.0
+}
+DEFAULT_RATE = 5.0
+MIN_RATE = 0.2
+MAX_RATE = 20.0
+# The amount of requests which may be sent at once after a quiet period
+BURST = 3
+# The additive increase (per healthy response) and the multiplicative
+# decrease (per throttled or slow response) of the rate
+RATE_INCREASE = 0.05
+RATE_DECREASE = 0.5
+# The time (in seconds) after a decrease in which the rate is not
+# decreased again, so a burst of errors only counts once
+DECREASE_COOLDOWN = 1.0
+# A response is slow when the average latency is this many times the
+# baseline latency. The baseline follows a drop of the average latency
+# at once, but a rise only slowly, so a lasting change in the latency
+# of a host (like other requests) becomes the new baseline.
+LATENCY_FACTOR = 2.0
+LATENCY_WEIGHT = 0.2
+BASELINE_WEIGHT = 0.02
+
+# The statuses which mean that the request may succeed when retried.
+# A 403 is only retried when it has a Retry-After header, otherwise it
+# is a permanent refusal.
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+THROTTLE_STATUSES = (429, 503)
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+
+class HostGovernor(object):
+    """ Limits the rate of requests to a single host with a token
+    bucket. The rate adapts itself: it increases a little with every
+    healthy response and is halved when the host throttles, fails or
+    becomes slow (additive increase, multiplicative decrease). The
+    governor may be used from multiple threads.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=BURST, min_rate=MIN_RATE,
+                 max_rate=MAX_RATE):
+        """ Creates a governor with a full bucket.
+
+        Parameters:
+            rate - float. The initial amount of requests per second.
+            burst - int. The size of the bucket.
+            min_rate - float. The lowest rate.
+            max_rate - float. The highest rate.
+        """
+        self.rate = float(rate)
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.latency = None
+        self.baseline_latency = None
+        self._tokens = float(burst)
+        self._updated = time()
+        self._decreased = 0.0
+        self._lock = Lock()
+
+    def acquire(self):
+        """ Waits until a request may be sent. Every call takes a token,
+        so waiting threads are served in the order they arrived.
+        """
+        with self._lock:
+            now = time()
+            self._tokens = min(self.burst, self._tokens +
+                               (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            sleep(wait)
+
+    def success(self, latency):
+        """ Registers a healthy response.
+
+        Parameters:
+            latency - float. The time the request took in seconds.
+        """
+        with self._lock:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += LATENCY_WEIGHT * (latency - self.latency)
+            if self.baseline_latency is None or \
+                    self.latency < self.baseline_latency:
+                self.baseline_latency = self.latency
+            else:
+                self.baseline_latency += BASELINE_WEIGHT * (
+                    self.latency - self.baseline_latency)
+            if self.latency > LATENCY_FACTOR * self.baseline_latency:
+                self._decrease()
+            else:
+                self.rate = min(self.max_rate, self.rate + RATE_INCREASE)
+
+    def throttled(self):
+        """ Registers a response which shows the host is overloaded."""
+        with self._lock:
+            self._decrease()
+
+    def _decrease(self):
+        """ Lowers the rate, unless it was lowered very recently. Must
+        be called with the lock.
+        """
+        now = time()
+        if now - self._decreased >= DECREASE_COOLDOWN:
+            self.rate = max(self.min_rate, self.rate * RATE_DECREASE)
+            self._decreased = now
+
+
+_governors = {}
+_governor_lock = Lock()
+
+
+def set_host_rate(host, rate, **kwargs):
+    """ Replaces the governor of a host. The keyword arguments are
+    passed to HostGovernor.
+
+    Parameters:
+        host - string. The host name, for example 'rest.kegg.jp'.
+        rate - float. The initial amount of requests per second.
+    Returns:
+        The created HostGovernor.
+    """
+    with _governor_lock:
+        _governors[host] = HostGovernor(rate, **kwargs)
+        return _governors[host]
+
+
+def get_governor(host):
+    """ Retrieves (or creates) the governor of a host."""
+    with _governor_lock:
+        if host not in _governors:
+            _governors[host] = HostGovernor(DEFAULT_RATES.get(host,
+                                                              DEFAULT_RATE))
+        return _governors[host]
+
+
+def is_retryable(error):
+    """ Checks whether a failed request may succeed when it is sent
+    again: server errors, throttling and connection problems.
+    """
+    if isinstance(error, HTTPError):
+        if error.code == 403:
+            return get_retry_after(error) is not None
+        return error.code in RETRY_STATUSES
+    return isinstance(error, (HTTPException, IOError))
+
+
+def is_throttled(error):
+    """ Checks whether the error shows that the host is overloaded:
+    a status of THROTTLE_STATUSES, a 403 with a Retry-After header or a
+    timeout. Other errors, like a refused connection or a 500, do not
+    slow down the host.
+    """
+    if isinstance(error, HTTPError):
+        if error.code == 403:
+            return get_retry_after(error) is not None
+        return error.code in THROTTLE_STATUSES
+    if isinstance(error, URLError):
+        error = error.reason
+    return isinstance(error, timeout)
+
+
+def get_retry_after(error):
+    """ Retrieves the Retry-After header of a failed request.
+
+    Parameters:
+        error - Exception. The error of the failed request.
+    Returns:
+        The value of the header, or None when it is not available.
+    """
+    headers = getattr(error, 'hdrs', None) or {}
+    return headers.get('retry-after') if hasattr(headers, 'get') else None
+
+
+def get_backoff(attempt, error=None):
+    """ Calculates the time to wait before a retry, with exponential
+    backoff and full jitter. A Retry-After header of the error is
+    respected.
+
+    Parameters:
+        attempt - int. The number of the failed attempt, starting at 0.
+        error - Exception. The error of the failed attempt.
+    Returns:
+        The time to wait in seconds.
+    """
+    delay = uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    retry_after = get_retry_after(error)
+    if retry_after is not None:
+        try:
+            delay = max(delay, min(BACKOFF_MAX, float(retry_after)))
+        except ValueError:
+            pass
+    return delay
@@ -0,0 +1,208 @@
+import os
+from hashlib import sha1
+from tempfile import mkstemp
+from threading import Lock
+from time import time
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+DAY = 24 * 60 * 60
+
+# The time (in seconds) a response stays valid per host. The data of
+# these services barely changes, so it is safe to keep it for a while.
+DEFAULT_TTLS = {
+    'rest.kegg.jp': 7 * DAY,
+    'www.genome.jp': 7 * DAY,
+    'pfam.xfam.org': 30 * DAY,
+    'biodbnet-abcc.ncifcrf.gov': 30 * DAY
+}
+
+
+class ResponseCache(object):
+    """ A cache which stores the responses of urls on disk. Every url
+    is stored in its own file, named after the hash of the url. Each
+    file starts with a line containing the status of the response:
+    'ok' for regular responses and 'missing' for negative results (for
+    example a 404). Note that a negative result in the body of a
+    response, like the '-' of bioDBnet, is cached as a regular
+    response.
+
+    Entries expire after the time to live of their host. When the
+    total size of the cache grows over the maximum size, the least
+    recently used entries are removed. The access time of a file is
+    used to determine the last use of an entry and the modification
+    time to determine when the entry was stored.
+    """
+
+    ok = b'ok'
+    missing = b'missing'
+
+    def __init__(self, directory, max_size=512 * 1024 * 1024, ttls=None,
+                 default_ttl=DAY, negative_ttl=DAY):
+        """ Creates the cache in the given directory.
+
+        Parameters:
+            directory - string. The directory to store the entries in.
+            It is created when it does not exist.
+            max_size - int. The maximum size of all the entries
+            together in bytes.
+            ttls - dictionary. Host names as keys and the time to live
+            in seconds as values. Defaults to DEFAULT_TTLS.
+            default_ttl - int. The time to live of hosts which are not
+            in ttls.
+            negative_ttl - int. The time to live of negative results.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        self.negative_ttl = negative_ttl
+        self._lock = Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._size = sum(size for _, size, _ in self._entries())
+
+    def _path(self, url):
+        return os.path.join(self.directory,
+                            sha1(url.encode()).hexdigest() + '.cache')
+
+    def _entries(self):
+        """ Generates a tuple with the path, size and access time of
+        every entry in the cache directory.
+        """
+        for name in os.listdir(self.directory):
+            if name.endswith('.cache'):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_atime
+
+    def get_ttl(self, url):
+        """ Retrieves the time to live of the host of the url."""
+        return self.ttls.get(urlparse(url).netloc, self.default_ttl)
+
+    def get(self, url):
+        """ Retrieves the cached response of the url.
+
+        Parameters:
+            url - string. The url of the response.
+        Returns:
+            A tuple with the status ('ok' or 'missing') and the content
+            as bytes. When the url is not cached or is expired, None is
+            returned.
+        """
+        path = self._path(url)
+        try:
+            with open(path, 'rb') as file:
+                status = file.readline().rstrip(b'\n')
+                content = file.read()
+            stored = os.stat(path).st_mtime
+        except (IOError, OSError):
+            return None
+        ttl = self.negative_ttl if status == self.missing else \
+            self.get_ttl(url)
+        if time() - stored > ttl:
+            with self._lock:
+                self._remove(path)
+            return None
+        # Mark the entry as recently used, but keep the store time. The
+        # entry may have been removed or replaced in the meantime.
+        try:
+            os.utime(path, (time(), stored))
+        except OSError:
+            pass
+        return status, content
+
+    def set(self, url, content, status=ok):
+        """ Stores the response of the url in the cache.
+
+        Parameters:
+            url - string. The url of the response.
+            content - bytes. The content of the response.
+            status - bytes. ResponseCache.ok or ResponseCache.missing.
+        """
+        path = self._path(url)
+        # Write to a temporary file first, so readers never see a
+        # half written entry
+        handle, temp_path = mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as file:
+            file.write(status + b'\n')
+            file.write(content)
+        size = os.path.getsize(temp_path)
+        with self._lock:
+            if os.path.exists(path):
+                self._size -= os.path.getsize(path)
+            os.rename(temp_path, path)
+            self._size += size
+            if self._size > self.max_size:
+                self._evict()
+
+    def set_missing(self, url):
+        """ Stores a negative result for the url."""
+        self.set(url, b'', self.missing)
+
+    def _remove(self, path):
+        """ Removes an entry and subtracts the size it had when it was
+        removed. Must be called with the lock.
+        """
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        self._size -= size
+
+    def _evict(self):
+        """ Removes the least recently used entries until the cache is
+        below 90% of the maximum size. Must be called with the lock.
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        target = self.max_size * 0.9
+        for path, _, _ in entries:
+            if self._size <= target:
+                break
+            self._remove(path)
+
+    def clear(self):
+        """ Removes all entries of the cache."""
+        with self._lock:
+            for path, _, _ in list(self._entries()):
+                self._remove(path)
+
+    def get_size(self):
+        """ Returns the total size of the entries in bytes."""
+        return self._size
+
+
+_cache = None
+
+
+def configure_cache(directory, **kwargs):
+    """ Creates the cache which is used by all downloads in utils. The
+    keyword arguments are passed to ResponseCache.
+
+    Parameters:
+        directory - string. The directory to store the entries in.
+    Returns:
+        The created ResponseCache.
+    """
+    global _cache
+    _cache = ResponseCache(directory, **kwargs)
+    return _cache
+
+
+def disable_cache():
+    """ Stops caching the downloads."""
+    global _cache
+    _cache = None
+
+
+def get_cache():
+    """ Returns the configured ResponseCache or None when caching is
+    disabled.
+    """
+    return _cache
@@ -1,8 +1,32 @@
+from collections import OrderedDict
+from io import BytesIO
 from json import loads
+from multiprocessing.pool import ThreadPool
+from threading import BoundedSemaphore, Lock
+from time import sleep, time
+from http_client import get_client
+from metrics import get_metrics
+from rate_limit import MAX_RETRIES, get_backoff, get_governor, \
+    is_retryable, is_throttled
+from response_cache import get_cache
 try:
-    import urllib.request as urllib
+    from urllib.error import HTTPError
+    from urllib.parse import urlparse
 except ImportError:
-    import urllib
+    from urllib2 import HTTPError
+    from urlparse import urlparse
+
+# The KEGG REST API to retrieve entries with and the maximum amount of
+# entries which can be retrieved in a single request
+KEGG_GET_URL = 'http://rest.kegg.jp/get/'
+KEGG_MAX_ENTRIES = 10
+
+# The amount of requests which may run at the same time against a
+# single host when fetching concurrently
+DEFAULT_HOST_LIMIT = 4
+_host_limits = {}
+_host_semaphores = {}
+_host_lock = Lock()
 
 
 def get_line(lines, starting):
@@ -30,6 +54,223 @@ def get_line(lines, starting):
     return ""
 
 
+def set_host_limit(host, limit):
+    """ Sets the maximum amount of concurrent requests to a host. This
+    only has effect on hosts which have not been contacted yet.
+
+    Arguments:
+        host - string. The host name, for example 'rest.kegg.jp'.
+        limit - int. The maximum amount of simultaneous requests.
+    """
+    if limit < 1:
+        raise ValueError('The host limit must be at least 1!')
+    with _host_lock:
+        _host_limits[host] = limit
+        _host_semaphores.pop(host, None)
+
+
+def _get_host_semaphore(host):
+    """ Retrieves (or creates) the semaphore guarding the given host."""
+    with _host_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = BoundedSemaphore(
+                _host_limits.get(host, DEFAULT_HOST_LIMIT))
+        return _host_semaphores[host]
+
+
+def open_url(url, use_cache=True):
+    """ Downloads the complete response of the url with the shared
+    HTTPClient of http_client, while respecting the concurrency limit
+    of the host. The response is read completely so the host slot and
+    the connection are released as soon as possible. The requests per
+    second are limited by the governor of the host in rate_limit, and
+    failures which may be temporary are retried with a backoff. When a
+    cache has been configured in response_cache, the response is served
+    from and stored in that cache. Every request is recorded in the
+    metrics.
+
+    Arguments:
+        url - string. The url to download.
+        use_cache - boolean. Whether the cache may be used for this
+        url.
+    Returns:
+        A file like object containing the bytes of the response.
+    """
+    metrics = get_metrics()
+    cache = get_cache() if use_cache else None
+    if cache is not None:
+        cached = cache.get(url)
+        if cached is not None:
+            metrics.record_request(url, cached=True)
+            status, content = cached
+            if status == cache.missing:
+                raise HTTPError(url, 404, 'Not Found (cached)', None, None)
+            return BytesIO(content)
+    host = urlparse(url).netloc
+    governor = get_governor(host)
+    attempt = 0
+    while True:
+        governor.acquire()
+        with _get_host_semaphore(host):
+            start = time()
+            try:
+                content = get_client().fetch(url)
+            except Exception as error:
+                metrics.record_request(url, seconds=time() - start,
+                                       error=True)
+                if not is_retryable(error) or attempt >= MAX_RETRIES:
+                    # Remember entries which do not exist
+                    if cache is not None and isinstance(error, HTTPError) \
+                            and error.code == 404:
+                        cache.set_missing(url)
+                    raise
+                if is_throttled(error):
+                    governor.throttled()
+                delay = get_backoff(attempt, error)
+            else:
+                governor.success(time() - start)
+                metrics.record_request(url, len(content), time() - start)
+                break
+        # Wait outside of the host slot, so other requests can continue
+        sleep(delay)
+        attempt += 1
+    if cache is not None:
+        cache.set(url, content)
+    return BytesIO(content)
+
+
+def fetch_all(function, items, workers=1):
+    """ Calls the function for every item, using a pool of worker
+    threads when more than 1 worker is requested. The order of the
+    results is always the same as the order of the items.
+
+    Arguments:
+        function - callable. The function which is called with a
+        single item.
+        items - iterable. The items to call the function with.
+        workers - int. The amount of worker threads to use.
+    Returns:
+        A list with the results of the function for each item.
+    """
+    items = list(items)
+    if workers <= 1 or len(items) < 2:
+        return [function(item) for item in items]
+    pool = ThreadPool(min(workers, len(items)))
+    try:
+        return pool.map(function, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def split_kegg_records(connection):
+    """ Splits a KEGG response which contains multiple entries into the
+    separate records. Each record ends with a '///' line.
+
+    Arguments:
+        connection - File like object. The response of the KEGG API.
+    Returns:
+        A list with the records as bytes.
+    """
+    records = []
+    lines = []
+    line = connection.readline()
+    while line:
+        lines.append(line)
+        if line.strip() == b'///':
+            records.append(b''.join(lines))
+            lines = []
+        line = connection.readline()
+    # A record without the closing line
+    if b''.join(lines).strip():
+        records.append(b''.join(lines))
+    return records
+
+
+def _get_record_entry(record):
+    """ Retrieves the identifier on the ENTRY line of a KEGG record."""
+    first_line = record.lstrip().split(b'\n', 1)[0].decode()
+    if first_line.startswith('ENTRY'):
+        identifier = first_line[len('ENTRY'):].split()
+        if identifier:
+            return identifier[0].lower()
+    return None
+
+
+def _get_kegg_chunk(entries):
+    """ Retrieves multiple KEGG entries with a single request.
+
+    Arguments:
+        entries - list. The KEGG entries to retrieve, like
+        'path:asn00010' or 'reaction:R00001'.
+    Returns:
+        A dictionary with the entries as keys and their records (bytes)
+        as values. Entries which do not exist are left out.
+    """
+    try:
+        connection = open_url(KEGG_GET_URL + '+'.join(entries),
+                              use_cache=False)
+    except HTTPError as error:
+        # None of the entries exist
+        if error.code == 404:
+            return {}
+        raise
+    records = split_kegg_records(connection)
+    connection.close()
+    by_entry = {}
+    for record in records:
+        by_entry[_get_record_entry(record)] = record
+    entry_records = {}
+    for entry in entries:
+        # The ENTRY line does not contain the database prefix
+        identifier = entry.split(':')[-1].lower()
+        if identifier in by_entry:
+            entry_records[entry] = by_entry[identifier]
+    return entry_records
+
+
+def get_kegg_records(entries, workers=1):
+    """ Retrieves KEGG entries by combining up to KEGG_MAX_ENTRIES
+    entries in a single request. Every record is cached as if it was
+    retrieved on its own, so only entries which are not cached are
+    requested.
+
+    Arguments:
+        entries - iterable. The KEGG entries to retrieve, like
+        'asn:102375123' or 'path:asn00010'.
+        workers - int. The amount of requests which may run at the same
+        time.
+    Returns:
+        A dictionary with the entries as keys and the records of the
+        entries (bytes) as values. Entries which do not exist are left
+        out.
+    """
+    entries = list(OrderedDict.fromkeys(entries))
+    cache = get_cache()
+    records = {}
+    pending = []
+    for entry in entries:
+        cached = cache.get(KEGG_GET_URL + entry) if cache else None
+        if cached is None:
+            pending.append(entry)
+        else:
+            get_metrics().record_request(KEGG_GET_URL + entry, cached=True)
+            if cached[0] == cache.ok:
+                records[entry] = cached[1]
+    chunks = [pending[i:i + KEGG_MAX_ENTRIES]
+              for i in range(0, len(pending), KEGG_MAX_ENTRIES)]
+    for chunk, entry_records in zip(chunks, fetch_all(_get_kegg_chunk,
+                                                      chunks, workers)):
+        for entry in chunk:
+            if entry in entry_records:
+                records[entry] = entry_records[entry]
+                if cache is not None:
+                    cache.set(KEGG_GET_URL + entry, entry_records[entry])
+            elif cache is not None:
+                cache.set_missing(KEGG_GET_URL + entry)
+    return {entry: records[entry] for entry in entries if entry in records}
+
+
 def convert_gi_to_asn(protein_code):
     """ Does the API call to retrieve the ASN code for the protein
     code.
@@ -40,11 +281,56 @@ def convert_gi_to_asn(protein_code):
     Returns:
         When available, the asn code.
     """
-    connection = urllib.urlopen(
+    return convert_gis_to_asns([protein_code])[str(protein_code)]
+
+
+def _convert_gi_chunk(protein_codes):
+    """ Does a single API call to convert multiple protein codes to
+    ASN codes.
+
+    Arguments:
+        protein_codes - list. A list of protein codes (strings).
+    Returns:
+        A list of tuples with the protein code and its ASN code.
+    """
+    connection = open_url(
         'https://biodbnet-abcc.ncifcrf.gov/webServices/rest.php/biodbnetRestAp'
         'i.json?method=db2db&input=ginumber&inputValues={}&outputs=kegggeneid&'
-        'format=row'.format(str(protein_code)))
-    # Only read the first line
+        'format=row'.format(','.join(protein_codes)))
     json = loads(connection.read().decode())
     connection.close()
-    return json[0]['KEGG Gene ID']
+    # Every row contains the input value, but fall back to the order
+    # of the rows which is the same as the order of the input values
+    return [(row.get('InputValue', protein_code), row['KEGG Gene ID'])
+            for protein_code, row in zip(protein_codes, json)]
+
+
+def convert_gis_to_asns(protein_codes, chunk_size=100, workers=1):
+    """ Converts multiple protein codes to ASN codes. The protein codes
+    are split into chunks and each chunk is converted with a single
+    API call.
+
+    Arguments:
+        protein_codes - iterable. The protein codes (strings or ints)
+        to convert.
+        chunk_size - int. The maximum amount of protein codes in a
+        single API call.
+        workers - int. The amount of API calls which may run at the
+        same time.
+    Returns:
+        A dictionary with the protein codes (as strings) as keys and
+        the ASN codes as values. Protein codes which could not be
+        converted have '-' as value.
+    """
+    if chunk_size < 1:
+        raise ValueError('The chunk size must be at least 1!')
+    protein_codes = [str(protein_code) for protein_code in protein_codes]
+    unique_codes = list(OrderedDict.fromkeys(protein_codes))
+    chunks = [unique_codes[i:i + chunk_size]
+              for i in range(0, len(unique_codes), chunk_size)]
+    asn_codes = {}
+    for rows in fetch_all(_convert_gi_chunk, chunks, workers):
+        for protein_code, asn_code in rows:
+            asn_codes[str(protein_code)] = asn_code
+    return {protein_code: asn_codes.get(protein_code, '-')
+            for protein_code in protein_codes}